@@ -57,6 +57,9 @@ object VerifyCoverageThresholdsTask {
   private const val ZERO_DELTA_LABEL = "0.00pp"
   private const val POSITIVE_DELTA_PATTERN = "+%.2fpp"
   private const val NEGATIVE_DELTA_PATTERN = "-%.2fpp"
+  private const val DEFAULT_COUNTER = "LINE"
+  private val COUNTER_TYPES =
+    setOf("INSTRUCTION", "BRANCH", "LINE", "COMPLEXITY", "METHOD", "CLASS")
   private val json = Json { ignoreUnknownKeys = true }
   private val DEFAULT_THRESHOLDS =
     mapOf(
@@ -220,7 +223,8 @@ object VerifyCoverageThresholdsTask {
   ): TaskOutcome {
     val classifier = LayerClassifier.fromConfig(layerMapPath, json)
     val thresholds = loadThresholdOverrides(metadataPath)
-    val parser = CoverageReportParser(classifier, thresholds, logger)
+    val counters = loadThresholdCounters(metadataPath)
+    val parser = CoverageReportParser(classifier, thresholds, counters, logger)
     val parseResult = parser.parse(parsedArgs.reportXml, parsedArgs.buildId)
     val violation = verifyThresholds(parseResult.summary)
     val trend = buildTrendPoints(parseResult.summary)
@@ -258,6 +262,34 @@ object VerifyCoverageThresholdsTask {
     return DEFAULT_THRESHOLDS + overrides
   }
 
+  /**
+   * JaCoCo counter each layer's threshold applies to, from the optional `counter` key of its
+   * metadata entry. Layers without one, or with an unknown counter type, use LINE.
+   */
+  internal fun loadThresholdCounters(path: Path): Map<TestLayer, String> {
+    val counters = mutableMapOf<TestLayer, String>()
+    runCatching {
+      val root = json.parseToJsonElement(path.readText()).jsonObject
+      val metrics = root["metrics"]?.jsonArray ?: return@runCatching
+      metrics.forEach { element ->
+        val node = element.jsonObject
+        val layerName = node["layer"]?.jsonPrimitive?.content ?: return@forEach
+        val layer =
+          runCatching { TestLayer.valueOf(layerName.uppercase(Locale.ROOT)) }.getOrNull()
+            ?: return@forEach
+        val counter = node["counter"]?.jsonPrimitive?.content ?: return@forEach
+        if (counter in COUNTER_TYPES) {
+          counters[layer] = counter
+        } else {
+          logger.warning(
+            "verifyCoverage: unknown counter '$counter' for $layer in $path, using $DEFAULT_COUNTER"
+          )
+        }
+      }
+    }
+    return TestLayer.entries.associateWith { layer -> counters[layer] ?: DEFAULT_COUNTER }
+  }
+
   internal fun newDocumentBuilderForTest(): DocumentBuilder = createDocumentBuilder(logger)
 
   private fun buildTrendPoints(summary: CoverageSummary): List<CoverageTrendPoint> {
@@ -350,6 +382,7 @@ object VerifyCoverageThresholdsTask {
   private class CoverageReportParser(
     private val classifier: LayerClassifier,
     private val thresholds: Map<TestLayer, Double> = DEFAULT_THRESHOLDS,
+    private val counters: Map<TestLayer, String> = emptyMap(),
     private val logger: Logger,
   ) {
     fun parse(reportXml: Path, buildIdOverride: String?): ParseResult {
@@ -401,10 +434,10 @@ object VerifyCoverageThresholdsTask {
         unmapped += className
         return
       }
-      val lineCounter = findLineCounter(node)
-      if (lineCounter != null) {
-        val missed = lineCounter.getAttribute("missed").toLong()
-        val covered = lineCounter.getAttribute("covered").toLong()
+      val counter = findCounter(node, counters[layer] ?: DEFAULT_COUNTER)
+      if (counter != null) {
+        val missed = counter.getAttribute("missed").toLong()
+        val covered = counter.getAttribute("covered").toLong()
         val total = missed + covered
         if (total != 0L) {
           val layerTotals = totals.getValue(layer)
@@ -646,9 +679,9 @@ private fun JsonElement.asLayer(): TestLayer =
     else -> throw IllegalArgumentException("Layer names must be string primitives")
   }
 
-private fun findLineCounter(element: Element): Element? {
+private fun findCounter(element: Element, type: String): Element? {
   for (child in element.childElements()) {
-    if (child.tagName == "counter" && child.getAttribute("type") == "LINE") {
+    if (child.tagName == "counter" && child.getAttribute("type") == type) {
       return child
     }
   }
@@ -54,4 +54,25 @@ class VerifyCoverageThresholdsTaskMetadataTest {
     assertThat(overrides.getValue(TestLayer.VIEW_MODEL)).isEqualTo(75.0)
     assertThat(overrides.getValue(TestLayer.DATA)).isEqualTo(70.0)
   }
+
+  @Test
+  fun `parses threshold counters from metadata`() {
+    metadataFile.writeText(
+      """
+      {
+        "metrics": [
+          {"layer": "UI", "minimumPercent": 72, "counter": "BRANCH"},
+          {"layer": "VIEW_MODEL", "minimumPercent": 80, "counter": "BOGUS"}
+        ]
+      }
+      """
+        .trimIndent()
+    )
+
+    val counters = VerifyCoverageThresholdsTask.loadThresholdCounters(metadataFile)
+
+    assertThat(counters.getValue(TestLayer.UI)).isEqualTo("BRANCH")
+    assertThat(counters.getValue(TestLayer.VIEW_MODEL)).isEqualTo("LINE")
+    assertThat(counters.getValue(TestLayer.DATA)).isEqualTo("LINE")
+  }
 }
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""Benchmark scripts/token_counter.py on synthetic repositories and compare with a baseline."""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+TOKEN_COUNTER = ROOT_DIR / "scripts" / "token_counter.py"
+DEFAULT_BASELINE = ROOT_DIR / "config" / "testing" / "tooling" / "token-counter-baselines.json"
+DEFAULT_REPORT = ROOT_DIR / "build" / "reports" / "token-counter-benchmark" / "summary.md"
+DEFAULT_JSON = ROOT_DIR / "build" / "reports" / "token-counter-benchmark" / "summary.json"
+
+DEFAULT_THRESHOLD = 0.25
+# Phases shorter than this are too noisy to report a rate for
+MIN_PHASE_SECONDS = 0.01
+
+# Metric -> whether a higher value is better
+METRICS: Dict[str, bool] = {
+    "walkFilesPerSecond": True,
+    "readBytesPerSecond": True,
+    "tokenizeCharsPerSecond": True,
+    "streamBytesPerSecond": True,
+    "tokensPerSecond": True,
+    "countSeconds": False,
+    "peakRssBytes": False,
+}
+
+WORDS = (
+    "val var fun class object return if else when for while import package override private "
+    "suspend data sealed interface companion null true false this super it Flow StateFlow "
+    "viewModelScope launch collect emit map filter repository model chat persona settings "
+    "download inference token cache state event result error message content index count"
+).split()
+PUNCTUATION = (" = ", ".", "(", ")", ", ", ": ", " { ", " }", " -> ", "?.", "[", "]", " + ")
+
+
+def synthetic_lines(rng: random.Random, count: int) -> List[str]:
+    """Code-like lines of varying indentation and length."""
+    lines = []
+    for _ in range(count):
+        parts = [" " * (4 * rng.randint(0, 4))]
+        for _ in range(rng.randint(2, 14)):
+            parts.append(rng.choice(WORDS))
+            parts.append(rng.choice(PUNCTUATION))
+        lines.append("".join(parts).rstrip())
+    return lines
+
+
+def write_text(path: Path, rng: random.Random, lines: List[str], size: int) -> None:
+    """Write roughly size bytes of text sampled from lines."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    chunks = []
+    written = 0
+    while written < size:
+        line = rng.choice(lines)
+        chunks.append(line)
+        written += len(line) + 1
+    path.write_text("\n".join(chunks) + "\n", encoding="utf-8")
+
+
+def write_binary(path: Path, rng: random.Random, size: int) -> None:
+    """Write size random bytes, with a NUL early on as real binaries have."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"\x89BIN\0" + rng.randbytes(max(size - 5, 0)))
+
+
+def generate_tiny_files(root: Path, rng: random.Random, scale: float) -> None:
+    """Thousands of small source files spread over a shallow tree."""
+    lines = synthetic_lines(rng, 2000)
+    extensions = (".kt", ".kt", ".kt", ".py", ".md", ".json", ".xml")
+    for index in range(int(4000 * scale)):
+        path = root / f"module{index % 40}" / "src" / f"pkg{index % 7}" / f"File{index}{rng.choice(extensions)}"
+        write_text(path, rng, lines, rng.randint(40, 600))
+
+
+def generate_huge_files(root: Path, rng: random.Random, scale: float) -> None:
+    """A few multi-megabyte files that take the streaming path."""
+    lines = synthetic_lines(rng, 5000)
+    for name in ("Generated.kt", "dump.json", "events.csv"):
+        write_text(root / "data" / name, rng, lines, int(4 * 1024 * 1024 * scale))
+
+
+def generate_ignored_tree(root: Path, rng: random.Random, scale: float) -> None:
+    """A small tracked tree next to deep, wide, gitignored build and dependency trees."""
+    lines = synthetic_lines(rng, 500)
+    (root / ".gitignore").write_text("build/\nnode_modules/\n*.tmp\n", encoding="utf-8")
+    for index in range(int(200 * scale)):
+        write_text(root / "src" / f"pkg{index % 10}" / f"Source{index}.kt", rng, lines, rng.randint(200, 2000))
+    ignored = int(20000 * scale)
+    for index in range(ignored):
+        top = "node_modules" if index % 2 else "build"
+        depth = 4 + index % 9
+        nested = Path(top, *(f"d{(index >> level) % 3}" for level in range(depth)))
+        path = root / nested / f"gen{index}.js"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("module.exports = {};\n", encoding="utf-8")
+        if index % 50 == 0:
+            (root / "src" / f"scratch{index}.tmp").write_text("tmp\n", encoding="utf-8")
+
+
+def generate_mixed_binaries(root: Path, rng: random.Random, scale: float) -> None:
+    """Text interleaved with binaries whose extensions are counted, so each is sniffed and skipped."""
+    lines = synthetic_lines(rng, 1000)
+    for index in range(int(300 * scale)):
+        write_text(root / "src" / f"Text{index}.kt", rng, lines, rng.randint(500, 8000))
+    extensions = (".model", ".pkl", ".class", ".wasm", ".onnx")
+    for index in range(int(300 * scale)):
+        write_binary(root / "assets" / f"asset{index}{rng.choice(extensions)}", rng, rng.randint(1024, 64 * 1024))
+    for index in range(max(int(4 * scale), 1)):
+        # Above the memory-map threshold
+        write_binary(root / "assets" / "large" / f"model{index}.onnx", rng, 2 * 1024 * 1024)
+
+
+SCENARIOS: Dict[str, Callable[[Path, random.Random, float], None]] = {
+    "tiny-files": generate_tiny_files,
+    "huge-files": generate_huge_files,
+    "ignored-tree": generate_ignored_tree,
+    "mixed-binaries": generate_mixed_binaries,
+}
+
+
+def parse_args(argv: Iterable[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=sorted(SCENARIOS),
+        help="Scenario to run; repeat for several (default: all)",
+    )
+    parser.add_argument("--tokenizer", default="gpt2", help="Tokenizer spec passed to token_counter.py (default: %(default)s)")
+    parser.add_argument("--offline", action="store_true", help="Pass --offline to token_counter.py")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Worker processes for token_counter.py (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per scenario; the median of each metric is kept (default: %(default)s)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply the size of every synthetic repository (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for generating the repositories (default: %(default)s)")
+    parser.add_argument("--work-dir", type=Path, help="Generate the repositories here instead of a temporary directory")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE, help="Baseline JSON (default: %(default)s)")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        help=f"Allowed relative regression per metric (default: the baseline's, else {DEFAULT_THRESHOLD})",
+    )
+    parser.add_argument("--update-baseline", action="store_true", help="Write the measured results as the new baseline instead of comparing")
+    parser.add_argument("--report", type=Path, default=DEFAULT_REPORT, help="Markdown summary path (default: %(default)s)")
+    parser.add_argument("--json", type=Path, default=DEFAULT_JSON, help="JSON summary path (default: %(default)s)")
+    args = parser.parse_args(list(argv)[1:])
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    if args.scale <= 0:
+        parser.error("--scale must be positive")
+    return args
+
+
+def rate(volume: float, seconds: float) -> Optional[float]:
+    """volume per second, or None when the phase did not run or was too short to measure."""
+    if not volume or seconds < MIN_PHASE_SECONDS:
+        return None
+    return volume / seconds
+
+
+def run_token_counter(repo: Path, args: argparse.Namespace, profile_path: Path) -> Tuple[int, Dict[str, Optional[float]]]:
+    """Count repo once and return its token total and metrics from the --profile-json report."""
+    command = [
+        sys.executable, str(TOKEN_COUNTER), str(repo), "-total",
+        "--tokenizer", args.tokenizer, "-j", str(args.jobs), "--profile-json", str(profile_path),
+    ]
+    if args.offline:
+        command.append("--offline")
+    completed = subprocess.run(command, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"token_counter.py failed on {repo} with status {completed.returncode}:\n{completed.stderr}")
+    report = json.loads(profile_path.read_text(encoding="utf-8"))
+    phases = report["phases"]
+
+    def phase(name: str) -> Dict[str, float]:
+        return phases.get(name, {"wallSeconds": 0.0, "volume": 0})
+
+    # Leave out tokenizer loading, which does not depend on the repository
+    count_seconds = report["wallSeconds"] - phase("load")["wallSeconds"]
+    metrics = {
+        "walkFilesPerSecond": rate(report["files"], phase("walk")["wallSeconds"]),
+        "readBytesPerSecond": rate(phase("read")["volume"], phase("read")["wallSeconds"]),
+        "tokenizeCharsPerSecond": rate(phase("encode")["volume"], phase("encode")["wallSeconds"]),
+        "streamBytesPerSecond": rate(phase("stream")["volume"], phase("stream")["wallSeconds"]),
+        "tokensPerSecond": rate(report["tokens"], count_seconds),
+        "countSeconds": count_seconds,
+        "peakRssBytes": max(report["peakRssBytes"], report["peakChildRssBytes"]),
+    }
+    return int(completed.stdout.split()[0]), metrics
+
+
+def run_scenario(name: str, work_dir: Path, args: argparse.Namespace) -> Dict[str, object]:
+    """Generate one synthetic repository and measure it args.repeat times."""
+    repo = work_dir / name
+    if repo.exists():
+        shutil.rmtree(repo)
+    repo.mkdir(parents=True)
+    print(f"[token-benchmark] generating {name}", file=sys.stderr)
+    SCENARIOS[name](repo, random.Random(f"{args.seed}:{name}"), args.scale)
+
+    totals = set()
+    runs: List[Dict[str, Optional[float]]] = []
+    for attempt in range(args.repeat):
+        print(f"[token-benchmark] {name}: run {attempt + 1}/{args.repeat}", file=sys.stderr)
+        total, metrics = run_token_counter(repo, args, work_dir / f"{name}.profile.json")
+        totals.add(total)
+        runs.append(metrics)
+    if len(totals) != 1:
+        raise RuntimeError(f"{name}: token totals differ between runs: {sorted(totals)}")
+
+    metrics = {}
+    for metric in METRICS:
+        values = [run[metric] for run in runs if run[metric] is not None]
+        if values:
+            metrics[metric] = statistics.median(values)
+    files = sum(1 for path in repo.rglob("*") if path.is_file())
+    return {"generatedFiles": files, "tokens": totals.pop(), "metrics": metrics}
+
+
+def environment(args: argparse.Namespace) -> Dict[str, object]:
+    """Settings that must match for two sets of results to be comparable."""
+    return {"tokenizer": args.tokenizer, "jobs": args.jobs, "scale": args.scale, "seed": args.seed}
+
+
+def compare(results: Dict[str, Dict[str, object]], baseline: Dict[str, object], threshold: float) -> Tuple[List[Dict[str, object]], List[str]]:
+    """Rows comparing each metric with the baseline, and the failures among them."""
+    rows: List[Dict[str, object]] = []
+    failures: List[str] = []
+    expected = baseline.get("scenarios", {})
+    for name, result in results.items():
+        reference = expected.get(name)
+        if reference is None:
+            failures.append(f"{name}: no baseline")
+            continue
+        if result["tokens"] != reference["tokens"]:
+            failures.append(f"{name}: token total changed from {reference['tokens']} to {result['tokens']}")
+        for metric, higher_is_better in METRICS.items():
+            value = result["metrics"].get(metric)
+            limit_base = reference["metrics"].get(metric)
+            if value is None or limit_base is None:
+                continue
+            if higher_is_better:
+                limit = limit_base * (1 - threshold)
+                failed = value < limit
+            else:
+                limit = limit_base * (1 + threshold)
+                failed = value > limit
+            change = (value - limit_base) / limit_base if limit_base else 0.0
+            status = "FAIL" if failed else "PASS"
+            rows.append(
+                {
+                    "scenario": name,
+                    "metric": metric,
+                    "value": value,
+                    "baseline": limit_base,
+                    "comparator": "≥" if higher_is_better else "≤",
+                    "limit": limit,
+                    "change": change,
+                    "status": status,
+                }
+            )
+            if failed:
+                failures.append(f"{name}/{metric}: expected {'≥' if higher_is_better else '≤'} {limit:.2f}, observed {value:.2f}")
+    return rows, failures
+
+
+def format_value(metric: str, value: float) -> str:
+    if metric == "peakRssBytes":
+        return f"{value / (1024 * 1024):.1f} MiB"
+    if metric == "countSeconds":
+        return f"{value:.3f} s"
+    return f"{value:,.0f}"
+
+
+def write_report(path: Path, summary: Dict[str, object]) -> None:
+    """Markdown summary of the comparison, in the layout of the macrobenchmark report."""
+    header = ["Scenario", "Metric", "Value", "Baseline", "Change", "Status"]
+    lines = ["# Token Counter Benchmark Summary", ""]
+    lines.append(f"- Baseline: `{summary['baseline']}`")
+    lines.append(f"- Threshold: {summary['threshold']:.0%}")
+    lines.append("")
+    lines.append("| " + " | ".join(header) + " |")
+    lines.append("| " + " | ".join(["---"] * len(header)) + " |")
+    if summary["metrics"]:
+        for row in summary["metrics"]:
+            status_cell = "✅ PASS" if row["status"] == "PASS" else "❌ FAIL"
+            lines.append(
+                f"| {row['scenario']} | {row['metric']} | {format_value(row['metric'], row['value'])} "
+                f"| {format_value(row['metric'], row['baseline'])} | {row['change']:+.1%} | {status_cell} |"
+            )
+    else:
+        lines.append("| _No metrics evaluated_ | | | | | |")
+    if summary["failures"]:
+        lines.append("")
+        lines.append("## Failing Checks")
+        for failure in summary["failures"]:
+            lines.append(f"- {failure}")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def main(argv: Iterable[str]) -> int:
+    args = parse_args(argv)
+    names = args.scenario or list(SCENARIOS)
+
+    with tempfile.TemporaryDirectory(prefix="token-benchmark-") as temporary:
+        work_dir = args.work_dir or Path(temporary)
+        work_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            results = {name: run_scenario(name, work_dir, args) for name in names}
+        except RuntimeError as error:
+            print(f"[token-benchmark] {error}", file=sys.stderr)
+            return 1
+
+    if args.update_baseline:
+        baseline = {"version": 1, "threshold": args.threshold if args.threshold is not None else DEFAULT_THRESHOLD}
+        if args.baseline.exists():
+            # Keep results for scenarios not run this time
+            baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+            if baseline.get("environment") != environment(args):
+                baseline["scenarios"] = {}
+            if args.threshold is not None:
+                baseline["threshold"] = args.threshold
+        baseline["environment"] = environment(args)
+        baseline.setdefault("scenarios", {}).update(results)
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(baseline, indent=2) + "\n", encoding="utf-8")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"[token-benchmark] baseline not found at {args.baseline}; record one with --update-baseline", file=sys.stderr)
+        return 1
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    if baseline.get("environment") != environment(args):
+        print(
+            f"[token-benchmark] baseline was recorded with {baseline.get('environment')}, "
+            f"not {environment(args)}; results are not comparable",
+            file=sys.stderr,
+        )
+        return 1
+    threshold = args.threshold if args.threshold is not None else baseline.get("threshold", DEFAULT_THRESHOLD)
+    rows, failures = compare(results, baseline, threshold)
+    summary = {
+        "status": "FAIL" if failures else "PASS",
+        "baseline": str(args.baseline),
+        "threshold": threshold,
+        "environment": environment(args),
+        "results": results,
+        "metrics": rows,
+        "failures": failures,
+    }
+    args.json.parent.mkdir(parents=True, exist_ok=True)
+    args.json.write_text(json.dumps(summary, indent=2) + "\n", encoding="utf-8")
+    write_report(args.report, summary)
+
+    print(summary["status"])
+    if failures:
+        print(f"[token-benchmark] performance regression detected. See {args.report}", file=sys.stderr)
+        return 1
+    print(f"Benchmark summary written to {args.report}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv))
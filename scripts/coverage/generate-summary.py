@@ -3,13 +3,21 @@
 from __future__ import annotations
 
 import argparse
+import glob
 import json
+import mmap
+import os
 import re
+import sqlite3
+import struct
+import subprocess
 import sys
+from array import array
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, Iterable, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 import xml.etree.ElementTree as ET
 
 
@@ -33,10 +41,42 @@ LAYER_DISPLAY_NAMES: Dict[str, str] = {
 
 STATUS_ORDER = ("BELOW_TARGET", "ON_TARGET", "EXCEEDS_TARGET")
 
+DEFAULT_TREND_BUILDS = 10
+
+# Exit status when changed code is below --diff-min-coverage
+EXIT_DIFF_BELOW_TARGET = 4
+
+# Per class: (source file, line covered, line missed, branch covered, branch missed)
+ClassCounters = Tuple[str, int, int, int, int]
+
+# JaCoCo counter types, in the order their (covered, missed) pairs are stored
+COUNTER_TYPES = ("INSTRUCTION", "BRANCH", "LINE", "COMPLEXITY", "METHOD", "CLASS")
+COUNTER_INDEX: Dict[str, int] = {counter: index for index, counter in enumerate(COUNTER_TYPES)}
+DEFAULT_COUNTER = "LINE"
+
+COUNTER_DISPLAY_NAMES: Dict[str, str] = {
+    "INSTRUCTION": "Instructions",
+    "BRANCH": "Branches",
+    "LINE": "Lines",
+    "COMPLEXITY": "Complexity",
+    "METHOD": "Methods",
+    "CLASS": "Classes",
+}
+
+# Packages listed in the markdown drill-down, lowest line coverage first
+MARKDOWN_PACKAGE_ROWS = 15
+
 
 def parse_args(argv: Iterable[str]) -> argparse.Namespace:
     parser = argparse.ArgumentParser(description=__doc__)
-    parser.add_argument("jacoco_xml", type=Path, help="Path to the merged JaCoCo XML report")
+    parser.add_argument(
+        "jacoco_xml",
+        nargs="+",
+        help=(
+            "Path to the merged JaCoCo XML report, or several per-module reports or glob "
+            "patterns (e.g. '*/build/reports/jacoco/**/*.xml') to merge"
+        ),
+    )
     parser.add_argument("markdown_output", type=Path, help="Path to write the markdown summary")
     parser.add_argument(
         "--json-output",
@@ -61,7 +101,90 @@ def parse_args(argv: Iterable[str]) -> argparse.Namespace:
             f"(default: {DEFAULT_COVERAGE_METADATA})"
         ),
     )
-    return parser.parse_args(list(argv)[1:])
+    parser.add_argument(
+        "--history-db",
+        dest="history_db",
+        type=Path,
+        help="SQLite store to record this run's layer and package metrics in and read the JSON trend from",
+    )
+    parser.add_argument(
+        "--build-id",
+        dest="build_id",
+        help=(
+            "Identifier of this build in the JSON summary and history (default with --history-db: $GITHUB_RUN_ID, "
+            "else the current UTC time; otherwise the first report's file name)"
+        ),
+    )
+    parser.add_argument("--branch", help="Git branch or tag of this build; the trend only follows builds of the same branch")
+    parser.add_argument(
+        "--trend-builds",
+        dest="trend_builds",
+        type=int,
+        default=DEFAULT_TREND_BUILDS,
+        help=f"Number of recent builds in the JSON trend (default: {DEFAULT_TREND_BUILDS})",
+    )
+    parser.add_argument(
+        "--snapshot-output",
+        dest="snapshot_output",
+        type=Path,
+        help="Write a compact binary snapshot of per-class LINE and BRANCH counters, to diff later builds against",
+    )
+    parser.add_argument(
+        "--diff-ref",
+        dest="diff_ref",
+        help="Summarize coverage of the files changed since this git ref (git diff REF...HEAD)",
+    )
+    parser.add_argument(
+        "--changed-files",
+        dest="changed_files",
+        type=Path,
+        help="Summarize coverage of the files listed in this file, one per line ('-' for stdin), instead of asking git",
+    )
+    parser.add_argument(
+        "--diff-base",
+        dest="diff_base",
+        type=Path,
+        help="Snapshot of the base branch to compare the changed files with",
+    )
+    parser.add_argument(
+        "--diff-min-coverage",
+        dest="diff_min_coverage",
+        type=float,
+        help=f"Exit with status {EXIT_DIFF_BELOW_TARGET} if line coverage of the changed files is below this percentage",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=0,
+        help="Worker processes for parsing several reports (default: one per CPU, at most one per report)",
+    )
+    args = parser.parse_args(list(argv)[1:])
+    if args.diff_ref is not None and args.changed_files is not None:
+        parser.error("--diff-ref and --changed-files cannot be combined")
+    if (args.diff_base is not None or args.diff_min_coverage is not None) and args.diff_ref is None and args.changed_files is None:
+        parser.error("--diff-base and --diff-min-coverage need --diff-ref or --changed-files")
+    return args
+
+
+def resolve_reports(patterns: Iterable[str]) -> List[Path]:
+    """Expand report paths and glob patterns into distinct existing files, in argument order."""
+    reports: List[Path] = []
+    for pattern in patterns:
+        # A literal path such as "reports/[debug]/jacoco.xml" is taken as is
+        if glob.has_magic(pattern) and not os.path.exists(pattern):
+            matches = sorted(glob.glob(pattern, recursive=True))
+            if not matches:
+                raise FileNotFoundError(f"No JaCoCo XML reports match: {pattern}")
+        else:
+            matches = [pattern]
+        for match in matches:
+            path = Path(match).resolve()
+            if not path.is_file():
+                raise FileNotFoundError(f"JaCoCo XML report not found: {path}")
+            if path not in reports:
+                reports.append(path)
+    return reports
 
 
 def load_layer_map(path: Path) -> Tuple[Tuple[str, Tuple[re.Pattern, ...]], Optional[str]]:
@@ -78,23 +201,109 @@ def load_layer_map(path: Path) -> Tuple[Tuple[str, Tuple[re.Pattern, ...]], Opti
     return tuple(patterns), default_layer
 
 
-def classify_layer(class_name: str, patterns: Tuple[Tuple[str, Tuple[re.Pattern, ...]], ...], default_layer: Optional[str]) -> Optional[str]:
-    normalized = class_name.replace(".", "/")
-    for layer, compiled_list in patterns:
-        for regex in compiled_list:
+REGEX_METACHARACTERS = frozenset(".^$*+?{}[]\\|()")
+
+
+def literal_prefix(expression: str) -> Optional[str]:
+    """The literal text every match of a ``^``-anchored expression starts with, or None if unanchored."""
+    if not expression.startswith("^") or "|" in expression:
+        return None
+    prefix = []
+    index = 1
+    while index < len(expression):
+        char = expression[index]
+        if char == "\\":
+            escaped = expression[index + 1:index + 2]
+            if not escaped or escaped.isalnum():
+                break
+            char = escaped
+            index += 1
+        elif char in REGEX_METACHARACTERS:
+            break
+        index += 1
+        if expression[index:index + 1] in ("*", "?", "{"):
+            # The character just read is optional
+            break
+        prefix.append(char)
+    return "".join(prefix)
+
+
+def ignores_nested_suffix(expression: str) -> bool:
+    """Whether an expression matches a nested class name (``Outer$Inner``) exactly when it matches ``Outer``.
+
+    Holds for ``^X.*$`` when X ends in "/" or is plain text: a match of X then
+    ends inside the outer class name, since a nested suffix has no "/" and
+    starts with "$".
+    """
+    for tail in (".*$", ".*"):
+        if expression.startswith("^") and expression.endswith(tail) and "|" not in expression:
+            body = expression[1:-len(tail)]
+            if body.endswith("\\"):
+                return False
+            return body.endswith("/") or not any(char in REGEX_METACHARACTERS for char in body)
+    return False
+
+
+class LayerClassifier:
+    """Classify class names by layer with first-match-wins semantics over the layer map.
+
+    Patterns are indexed by their literal prefix, so each package only tries
+    the patterns that can match somewhere inside it; the candidate list is
+    built once per package. When no pattern can tell nested classes from their
+    outer class, decisions are cached per outer class, so ``Foo$bar$1`` reuses
+    the decision for ``Foo``.
+    """
+
+    def __init__(self, patterns: Tuple[Tuple[str, Tuple[re.Pattern, ...]], ...], default_layer: Optional[str]) -> None:
+        self.default_layer = default_layer
+        self._rules: List[Tuple[str, re.Pattern, Optional[str]]] = [
+            (layer, regex, None if regex.flags & re.IGNORECASE else literal_prefix(regex.pattern))
+            for layer, compiled_list in patterns
+            for regex in compiled_list
+        ]
+        self._candidates: Dict[str, Tuple[Tuple[str, re.Pattern], ...]] = {}
+        self._decisions: Dict[str, Optional[str]] = {}
+        self._by_outer_class = all(ignores_nested_suffix(regex.pattern) for _, regex, _ in self._rules)
+
+    def _package_candidates(self, package: str) -> Tuple[Tuple[str, re.Pattern], ...]:
+        candidates = self._candidates.get(package)
+        if candidates is None:
+            # Names in the package all start with package + "/", so a pattern can
+            # only match if its literal prefix agrees with that as far as both go
+            directory = package + "/" if package else ""
+            candidates = tuple(
+                (layer, regex)
+                for layer, regex, prefix in self._rules
+                if prefix is None or directory.startswith(prefix) or prefix.startswith(directory)
+            )
+            self._candidates[package] = candidates
+        return candidates
+
+    def classify(self, class_name: str) -> Optional[str]:
+        key = class_name.partition("$")[0] if self._by_outer_class else class_name
+        if key in self._decisions:
+            return self._decisions[key]
+        normalized = class_name.replace(".", "/")
+        package = normalized.rpartition("/")[0]
+        decision = self.default_layer
+        for layer, regex in self._package_candidates(package):
             if regex.search(normalized):
-                return layer
-    return default_layer
+                decision = layer
+                break
+        self._decisions[key] = decision
+        return decision
 
 
-def load_thresholds(metadata_path: Path) -> Dict[str, float]:
+def load_thresholds(metadata_path: Path) -> Tuple[Dict[str, float], Dict[str, str]]:
+    """Minimum percentage per layer, and the JaCoCo counter each one applies to (LINE by default)."""
     thresholds = dict(DEFAULT_THRESHOLDS)
+    counters = {layer: DEFAULT_COUNTER for layer in thresholds}
     if not metadata_path.exists():
         print(
             f"[coverage] metadata not found at {metadata_path}, falling back to defaults",
             file=sys.stderr,
         )
-        return thresholds
+        return thresholds, counters
 
     try:
         payload = json.loads(metadata_path.read_text(encoding="utf-8"))
@@ -103,57 +312,220 @@ def load_thresholds(metadata_path: Path) -> Dict[str, float]:
             f"[coverage] failed to parse metadata {metadata_path}: {error}. Using defaults",
             file=sys.stderr,
         )
-        return thresholds
+        return thresholds, counters
 
     for entry in payload.get("metrics", []):
         layer = entry.get("layer")
+        if not layer:
+            continue
         minimum = entry.get("minimumPercent")
-        if layer and isinstance(minimum, (int, float)):
+        if isinstance(minimum, (int, float)):
             thresholds[layer] = float(minimum)
+        # Same rules as VerifyCoverageThresholdsTask.loadThresholdCounters, so the summary and the gate agree
+        counter = entry.get("counter", DEFAULT_COUNTER)
+        if counter not in COUNTER_INDEX:
+            print(
+                f"[coverage] unknown counter {counter!r} for {layer} in {metadata_path}, using {DEFAULT_COUNTER}",
+                file=sys.stderr,
+            )
+            counter = DEFAULT_COUNTER
+        counters[layer] = counter
+
+    return thresholds, counters
+
+
+def iter_class_counters(xml_path: Path) -> Iterable[Tuple[str, str, List[int]]]:
+    """Yield (class, source file, counts) for each report/package/class element that has lines.
+
+    counts holds covered and missed for every type in COUNTER_TYPES, in order.
+
+    The report is parsed incrementally and every element below a package is
+    dropped as soon as it ends, so memory stays bounded by the largest class
+    or source file rather than growing with the report.
+    """
+    # Open elements from the report root down to the current one
+    parents: List[ET.Element] = []
+    for event, elem in ET.iterparse(xml_path, events=("start", "end")):
+        if event == "start":
+            parents.append(elem)
+            continue
+        parents.pop()
+        if len(parents) == 2:
+            package = parents[1]
+            if elem.tag == "class" and package.tag == "package":
+                class_name = elem.get("name", "")
+                if class_name:
+                    counts = [0] * CounterTable.WIDTH
+                    has_lines = False
+                    for counter in elem.findall("counter"):
+                        index = COUNTER_INDEX.get(counter.get("type", ""))
+                        if index is not None:
+                            counts[2 * index] = int(counter.get("covered", "0"))
+                            counts[2 * index + 1] = int(counter.get("missed", "0"))
+                            has_lines = has_lines or index == COUNTER_INDEX["LINE"]
+                    if has_lines:
+                        source = source_key(package.get("name", ""), elem.get("sourcefilename", ""))
+                        yield class_name, source, counts
+            package.remove(elem)
+        elif len(parents) == 1:
+            parents[0].remove(elem)
+
+
+def source_key(package: str, source_file: str) -> str:
+    """Package-relative path of a source file, e.g. com/example/ui/Screen.kt."""
+    return f"{package}/{source_file}" if package else source_file
+
+
+class CounterTable:
+    """Covered and missed counts of every counter type per key, in one flat int64 array.
+
+    Rows are allocated in insertion order, so tables pickle compactly between
+    worker processes. Adding a class into a package or layer updates its row in
+    place, one short loop over the counter pairs, without allocating anything.
+    """
+
+    WIDTH = 2 * len(COUNTER_TYPES)
+
+    def __init__(self) -> None:
+        self.rows: Dict[str, int] = {}
+        self.values = array("q")
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.rows
+
+    def keys(self) -> Iterable[str]:
+        return self.rows.keys()
+
+    def row(self, key: str) -> int:
+        row = self.rows.get(key)
+        if row is None:
+            row = self.rows[key] = len(self.rows)
+            self.values.extend([0] * self.WIDTH)
+        return row
+
+    def add(self, key: str, counts: Sequence[int]) -> None:
+        start = self.row(key) * self.WIDTH
+        for index, value in enumerate(counts):
+            self.values[start + index] += value
+
+    def put(self, key: str, counts: Sequence[int]) -> None:
+        start = self.row(key) * self.WIDTH
+        self.values[start : start + self.WIDTH] = array("q", counts)
+
+    def counts(self, key: str) -> array:
+        start = self.rows[key] * self.WIDTH
+        return self.values[start : start + self.WIDTH]
+
+    def pair(self, key: str, counter: str) -> Tuple[int, int]:
+        """(covered, missed) of one counter type."""
+        start = self.rows[key] * self.WIDTH + 2 * COUNTER_INDEX[counter]
+        return self.values[start], self.values[start + 1]
+
+    def coverage(self, key: str, counter: str) -> Optional[float]:
+        return percentage(*self.pair(key, counter)) if key in self.rows else None
+
+    def summary(self, key: str) -> Dict[str, Dict[str, Union[int, float, None]]]:
+        """Covered, missed and percentage of every counter type, for JSON output."""
+        result = {}
+        for counter in COUNTER_TYPES:
+            covered, missed = self.pair(key, counter)
+            result[counter] = {"covered": covered, "missed": missed, "coverage": round_optional(percentage(covered, missed))}
+        return result
+
+
+class ClassCoverage(CounterTable):
+    """Per-class counters, with each class's source file."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.sources: List[str] = []
+
+    def put_class(self, class_name: str, source: str, counts: Sequence[int]) -> None:
+        if class_name in self.rows:
+            self.sources[self.rows[class_name]] = source
+        else:
+            self.sources.append(source)
+        self.put(class_name, counts)
+
+    def source(self, class_name: str) -> str:
+        return self.sources[self.rows[class_name]]
 
-    return thresholds
+    def line_branch_items(self) -> Iterator[Tuple[str, ClassCounters]]:
+        """(class, (source, line covered, line missed, branch covered, branch missed)) for every class."""
+        for class_name, row in self.rows.items():
+            yield class_name, (self.sources[row], *self.pair(class_name, "LINE"), *self.pair(class_name, "BRANCH"))
 
 
-def iter_class_line_counters(root: ET.Element) -> Iterable[Tuple[str, int, int]]:
-    for package in root.findall("package"):
-        for class_elem in package.findall("class"):
-            class_name = class_elem.get("name", "")
-            if not class_name:
-                continue
-            for counter in class_elem.findall("counter"):
-                if counter.get("type") == "LINE":
-                    covered = int(counter.get("covered", "0"))
-                    missed = int(counter.get("missed", "0"))
-                    yield class_name, covered, missed
-                    break
+def read_class_counters(xml_path: Path) -> ClassCoverage:
+    """Counters of each class in one report."""
+    classes = ClassCoverage()
+    for class_name, source, counts in iter_class_counters(xml_path):
+        classes.put_class(class_name, source, counts)
+    return classes
+
+
+def merge_class_counters(per_report: Iterable[ClassCoverage]) -> ClassCoverage:
+    merged: Optional[ClassCoverage] = None
+    for classes in per_report:
+        if merged is None:
+            merged = classes
+            continue
+        for class_name in classes.keys():
+            if class_name not in merged or classes.pair(class_name, "LINE")[0] > merged.pair(class_name, "LINE")[0]:
+                merged.put_class(class_name, classes.source(class_name), classes.counts(class_name))
+    return merged if merged is not None else ClassCoverage()
+
+
+def collect_class_counters(xml_paths: List[Path], jobs: int = 0) -> ClassCoverage:
+    """Parse reports in parallel and merge their class counters.
+
+    A class compiled into several modules' reports (a shared source set, or
+    the same module run under unit and instrumentation tests) is counted
+    once, with the report that covers most of its lines. Class-level
+    counters cannot tell which lines each report covered, so this is a
+    lower bound on the coverage of the reports combined.
+    """
+    workers = min(jobs or os.cpu_count() or 1, len(xml_paths))
+    if workers <= 1:
+        per_report = map(read_class_counters, xml_paths)
+        return merge_class_counters(per_report)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # map() yields in argument order, keeping the class order stable
+        return merge_class_counters(executor.map(read_class_counters, xml_paths))
 
 
 def compute_layer_metrics(
-    xml_path: Path, layer_map: Path, layer_thresholds: Dict[str, float]
-) -> Tuple[Dict[str, Dict[str, float]], Dict[str, int], Iterable[str]]:
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
-
-    patterns, default_layer = load_layer_map(layer_map)
-    totals: Dict[str, Dict[str, float]] = {
-        layer: {"covered": 0.0, "missed": 0.0} for layer in layer_thresholds
-    }
+    classes: ClassCoverage,
+    layer_map: Path,
+    layer_thresholds: Dict[str, float],
+    threshold_counters: Dict[str, str],
+) -> Tuple[Dict[str, Dict[str, float]], Dict[str, int], Iterable[str], CounterTable, CounterTable]:
+    """Layer metrics against their thresholds, plus all counters summed per package and per layer."""
+    classifier = LayerClassifier(*load_layer_map(layer_map))
+    layers = CounterTable()
+    for layer in layer_thresholds:
+        layers.row(layer)
+    packages = CounterTable()
     unmapped = []
 
-    for class_name, covered, missed in iter_class_line_counters(root):
-        layer = classify_layer(class_name, patterns, default_layer)
-        if layer not in totals:
+    for class_name in classes.keys():
+        counts = classes.counts(class_name)
+        packages.add(class_name.replace(".", "/").rpartition("/")[0], counts)
+        layer = classifier.classify(class_name)
+        if layer not in layer_thresholds:
             unmapped.append(class_name)
             continue
-        totals[layer]["covered"] += covered
-        totals[layer]["missed"] += missed
+        layers.add(layer, counts)
 
     metrics: Dict[str, Dict[str, float]] = {}
     status_counts: Dict[str, int] = defaultdict(int)
 
     for layer, threshold in layer_thresholds.items():
-        covered = totals[layer]["covered"]
-        missed = totals[layer]["missed"]
+        counter = threshold_counters.get(layer, DEFAULT_COUNTER)
+        covered, missed = layers.pair(layer, counter)
         total = covered + missed
         coverage = 0.0 if total == 0 else (covered / total) * 100.0
         delta = coverage - threshold
@@ -169,12 +541,355 @@ def compute_layer_metrics(
             "threshold": threshold,
             "delta": delta,
             "status": status,
+            "counter": counter,
+            "covered": covered,
+            "missed": missed,
         }
 
     for status in STATUS_ORDER:
         status_counts.setdefault(status, 0)
 
-    return metrics, status_counts, unmapped
+    return metrics, status_counts, unmapped, packages, layers
+
+
+def default_build_id() -> str:
+    """A build ID unique to this run, so each run adds a build to the history instead of replacing the last."""
+    return os.environ.get("GITHUB_RUN_ID") or datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S.%fZ")
+
+
+class CoverageHistory:
+    """Per-build layer and package counters in SQLite, for trends without re-reading old reports.
+
+    Builds are indexed by branch and time, so a trend reads only the rows of
+    the last few builds however long the history grows. Layers are stored with
+    the counter their threshold applies to, packages with their line counter.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS builds (
+            id INTEGER PRIMARY KEY,
+            build_id TEXT NOT NULL UNIQUE,
+            branch TEXT,
+            generated_at TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS builds_by_branch ON builds (branch, generated_at);
+        CREATE TABLE IF NOT EXISTS layer_metrics (
+            build INTEGER NOT NULL REFERENCES builds (id) ON DELETE CASCADE,
+            layer TEXT NOT NULL,
+            covered INTEGER NOT NULL,
+            missed INTEGER NOT NULL,
+            counter TEXT NOT NULL DEFAULT 'LINE',
+            PRIMARY KEY (build, layer)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS package_metrics (
+            build INTEGER NOT NULL REFERENCES builds (id) ON DELETE CASCADE,
+            package TEXT NOT NULL,
+            covered INTEGER NOT NULL,
+            missed INTEGER NOT NULL,
+            PRIMARY KEY (build, package)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(self.SCHEMA)
+        # Histories written before thresholds could target other counters hold LINE rows only
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(layer_metrics)")]
+        if "counter" not in columns:
+            with self.connection:
+                self.connection.execute("ALTER TABLE layer_metrics ADD COLUMN counter TEXT NOT NULL DEFAULT 'LINE'")
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def record(
+        self,
+        build_id: str,
+        branch: Optional[str],
+        generated_at: str,
+        metrics: Dict[str, Dict[str, float]],
+        packages: CounterTable,
+    ) -> None:
+        """Store a build's counters, replacing any earlier run with the same build ID."""
+        with self.connection:
+            self.connection.execute("DELETE FROM builds WHERE build_id = ?", (build_id,))
+            cursor = self.connection.execute(
+                "INSERT INTO builds (build_id, branch, generated_at) VALUES (?, ?, ?)",
+                (build_id, branch, generated_at),
+            )
+            build = cursor.lastrowid
+            self.connection.executemany(
+                "INSERT INTO layer_metrics (build, layer, covered, missed, counter) VALUES (?, ?, ?, ?, ?)",
+                [(build, layer, data["covered"], data["missed"], data["counter"]) for layer, data in metrics.items()],
+            )
+            self.connection.executemany(
+                "INSERT INTO package_metrics VALUES (?, ?, ?, ?)",
+                [(build, package, *packages.pair(package, "LINE")) for package in packages.keys()],
+            )
+
+    def trend(self, branch: Optional[str], builds: int) -> List[Dict[str, Union[str, float]]]:
+        """Layer coverage of the last builds on branch, oldest first, with the change since the build before.
+
+        A delta is only taken between builds that measured the layer with the
+        same counter; after a switch it restarts at zero.
+        """
+        # One build more than shown, to give the oldest one a delta
+        rows = self.connection.execute(
+            """
+            SELECT recent.build_id, layer_metrics.layer, layer_metrics.covered, layer_metrics.missed, layer_metrics.counter
+            FROM (
+                SELECT id, build_id, generated_at FROM builds
+                WHERE branch IS ?
+                ORDER BY generated_at DESC, id DESC
+                LIMIT ?
+            ) AS recent
+            JOIN layer_metrics ON layer_metrics.build = recent.id
+            ORDER BY recent.generated_at, recent.id, layer_metrics.layer
+            """,
+            (branch, builds + 1),
+        ).fetchall()
+        build_order = list(dict.fromkeys(build_id for build_id, _, _, _, _ in rows))
+        shown = set(build_order[-builds:]) if builds > 0 else set()
+
+        trend = []
+        # layer -> (counter, coverage) of the build before
+        previous: Dict[str, Tuple[str, float]] = {}
+        for build_id, layer, covered, missed, counter in rows:
+            total = covered + missed
+            coverage = 0.0 if total == 0 else (covered / total) * 100.0
+            last_counter, last_coverage = previous.get(layer, (counter, coverage))
+            if last_counter != counter:
+                print(
+                    f"[coverage] {layer} switched from {last_counter} to {counter} coverage at build {build_id}; "
+                    "its trend delta restarts there",
+                    file=sys.stderr,
+                )
+                last_coverage = coverage
+            if build_id in shown:
+                trend.append(
+                    {
+                        "buildId": build_id,
+                        "layer": layer,
+                        "counter": counter,
+                        "coverage": round(coverage, 2),
+                        "delta": round(coverage - last_coverage, 2),
+                    }
+                )
+            previous[layer] = (counter, coverage)
+        return trend
+
+
+DIFF_COVERAGE_KEYS = ("lineCoverage", "branchCoverage", "baseLineCoverage", "baseBranchCoverage")
+
+SNAPSHOT_MAGIC = b"JCSNAP01"
+# rows, strings, string bytes, source files
+SNAPSHOT_HEADER = struct.Struct("<4I")
+
+
+def _column_bytes(column: array) -> bytes:
+    """A uint32 column as little-endian bytes."""
+    if sys.byteorder == "big":
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def write_snapshot(path: Path, classes: ClassCoverage) -> None:
+    """Write per-class counters as little-endian uint32 columns with an interned string table.
+
+    Rows are sorted by source file and a sorted source file table records
+    each file's row range, so a reader can look up a file by binary search
+    and read just its rows.
+    """
+    strings: Dict[str, int] = {}
+
+    def intern(value: str) -> int:
+        return strings.setdefault(value, len(strings))
+
+    # package, simple name, line covered, line missed, branch covered, branch missed
+    columns = [array("I") for _ in range(6)]
+    # source, first row, row count
+    sources = [array("I") for _ in range(3)]
+    rows = sorted(classes.line_branch_items(), key=lambda item: (item[1][0], item[0]))
+    for row, (class_name, (source, *counts)) in enumerate(rows):
+        package, _, name = class_name.rpartition("/")
+        for column, value in zip(columns, (intern(package), intern(name), *counts)):
+            column.append(value)
+        source_index = intern(source)
+        if sources[0] and sources[0][-1] == source_index:
+            sources[2][-1] += 1
+        else:
+            for column, value in zip(sources, (source_index, row, 1)):
+                column.append(value)
+
+    blob = bytearray()
+    offsets = array("I", [0])
+    for value in strings:
+        blob += value.encode("utf-8")
+        offsets.append(len(blob))
+    blob += b"\0" * (-len(blob) % 4)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("wb") as handle:
+        handle.write(SNAPSHOT_MAGIC)
+        handle.write(SNAPSHOT_HEADER.pack(len(rows), len(strings), len(blob), len(sources[0])))
+        handle.write(_column_bytes(offsets))
+        handle.write(blob)
+        for column in sources + columns:
+            handle.write(_column_bytes(column))
+
+
+class CoverageSnapshot:
+    """Read-only view of a snapshot from write_snapshot that only touches the rows asked for."""
+
+    def __init__(self, path: Path) -> None:
+        with path.open("rb") as handle:
+            self._data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        self._offsets = len(SNAPSHOT_MAGIC) + SNAPSHOT_HEADER.size
+        if len(self._data) < self._offsets or self._data[: len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            self._data.close()
+            raise ValueError(f"Not a coverage snapshot: {path}")
+        self.rows, string_count, blob_size, self.source_count = SNAPSHOT_HEADER.unpack_from(self._data, len(SNAPSHOT_MAGIC))
+        self._blob = self._offsets + 4 * (string_count + 1)
+        self._sources = self._blob + blob_size
+        self._columns = self._sources + 3 * 4 * self.source_count
+        # The sections must add up to the file size exactly, and the string table fit in its blob
+        if (
+            len(self._data) != self._columns + 6 * 4 * self.rows
+            or self._uint(self._offsets + 4 * string_count) > blob_size
+        ):
+            self._data.close()
+            raise ValueError(f"Truncated or corrupt coverage snapshot: {path}")
+
+    def close(self) -> None:
+        self._data.close()
+
+    def _uint(self, offset: int) -> int:
+        return struct.unpack_from("<I", self._data, offset)[0]
+
+    def _string(self, index: int) -> str:
+        start, end = struct.unpack_from("<2I", self._data, self._offsets + 4 * index)
+        return self._data[self._blob + start : self._blob + end].decode("utf-8")
+
+    def _column(self, column: int, start: int, count: int) -> array:
+        offset = self._columns + 4 * (column * self.rows + start)
+        values = array("I", self._data[offset : offset + 4 * count])
+        if sys.byteorder == "big":
+            values.byteswap()
+        return values
+
+    def _source(self, field: int, index: int) -> int:
+        return self._uint(self._sources + 4 * (field * self.source_count + index))
+
+    def classes(self, source: str) -> List[Tuple[str, ClassCounters]]:
+        """The classes compiled from a source file, found by binary search over the source table."""
+        low, high = 0, self.source_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._string(self._source(0, middle)) < source:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self.source_count or self._string(self._source(0, low)) != source:
+            return []
+        start, count = self._source(1, low), self._source(2, low)
+        packages, names, *counts = (self._column(column, start, count) for column in range(6))
+        result = []
+        for row in range(count):
+            package = self._string(packages[row])
+            name = self._string(names[row])
+            class_name = f"{package}/{name}" if package else name
+            result.append((class_name, (source, *(column[row] for column in counts))))
+        return result
+
+
+def list_changed_files(diff_ref: Optional[str], changed_files: Optional[Path]) -> List[str]:
+    """Paths changed since diff_ref according to git, or listed in changed_files."""
+    if changed_files is not None:
+        text = sys.stdin.read() if str(changed_files) == "-" else changed_files.read_text(encoding="utf-8")
+    else:
+        text = subprocess.run(
+            ["git", "diff", "--name-only", "--diff-filter=d", f"{diff_ref}...HEAD"],
+            cwd=ROOT_DIR,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def sum_counters(counters: Iterable[ClassCounters]) -> List[int]:
+    totals = [0, 0, 0, 0]
+    for _, *counts in counters:
+        for index, value in enumerate(counts):
+            totals[index] += value
+    return totals
+
+
+def percentage(covered: int, missed: int) -> Optional[float]:
+    total = covered + missed
+    return None if total == 0 else (covered / total) * 100.0
+
+
+def compute_diff_coverage(
+    changed: List[str], classes: ClassCoverage, base: Optional[CoverageSnapshot]
+) -> Dict[str, object]:
+    """Line and branch coverage of the changed source files, now and in the base snapshot."""
+    by_source: Dict[str, List[ClassCounters]] = defaultdict(list)
+    for _, counters in classes.line_branch_items():
+        by_source[counters[0]].append(counters)
+
+    files = []
+    totals = [0, 0, 0, 0]
+    base_totals = [0, 0, 0, 0]
+    for path in changed:
+        parts = path.replace("\\", "/").split("/")
+        # The longest path suffix that names a compiled source file, e.g.
+        # com/example/ui/Screen.kt for app/src/main/java/com/example/ui/Screen.kt
+        for start in range(len(parts)):
+            source = "/".join(parts[start:])
+            current = by_source.get(source, [])
+            previous = [counters for _, counters in base.classes(source)] if base is not None else []
+            if current or previous:
+                break
+        else:
+            continue
+        counts = sum_counters(current)
+        base_counts = sum_counters(previous) if previous else None
+        totals = [total + value for total, value in zip(totals, counts)]
+        if base_counts is not None:
+            base_totals = [total + value for total, value in zip(base_totals, base_counts)]
+        files.append(
+            {
+                "path": path,
+                "source": source,
+                "lineCoverage": percentage(counts[0], counts[1]),
+                "branchCoverage": percentage(counts[2], counts[3]),
+                "baseLineCoverage": percentage(base_counts[0], base_counts[1]) if base_counts else None,
+                "baseBranchCoverage": percentage(base_counts[2], base_counts[3]) if base_counts else None,
+            }
+        )
+    return {
+        "files": files,
+        "lineCoverage": percentage(totals[0], totals[1]),
+        "branchCoverage": percentage(totals[2], totals[3]),
+        "baseLineCoverage": percentage(base_totals[0], base_totals[1]) if base is not None else None,
+        "baseBranchCoverage": percentage(base_totals[2], base_totals[3]) if base is not None else None,
+    }
+
+
+def format_optional_percentage(value: Optional[float]) -> str:
+    return "n/a" if value is None else format_percentage(value)
+
+
+def format_optional_delta(value: Optional[float], base: Optional[float]) -> str:
+    return "n/a" if value is None or base is None else format_delta(value - base)
+
+
+def round_optional(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value, 2)
 
 
 def format_percentage(value: float) -> str:
@@ -191,18 +906,22 @@ def format_delta(value: float) -> str:
 
 def write_markdown(
     path: Path,
-    xml_path: Path,
+    xml_paths: List[Path],
     metrics: Dict[str, Dict[str, float]],
     status_counts: Dict[str, int],
     unmapped: Iterable[str],
     layer_thresholds: Dict[str, float],
+    packages: CounterTable,
+    layers: CounterTable,
+    diff: Optional[Dict[str, object]] = None,
 ) -> None:
-    lines = ["# Coverage Summary", "", f"Source: `{xml_path}`", "", "| Layer | Coverage | Threshold | Delta | Status |", "| --- | ---: | ---: | ---: | --- |"]
+    lines = ["# Coverage Summary", "", "Source: " + ", ".join(f"`{xml_path}`" for xml_path in xml_paths), "", "| Layer | Coverage | Threshold | Delta | Status |", "| --- | ---: | ---: | ---: | --- |"]
     for layer in layer_thresholds:
         data = metrics[layer]
         lines.append(
             "| {layer_name} | {coverage} | {threshold} | {delta} | {status} |".format(
-                layer_name=LAYER_DISPLAY_NAMES[layer],
+                layer_name=LAYER_DISPLAY_NAMES[layer]
+                + ("" if data["counter"] == DEFAULT_COUNTER else f" ({COUNTER_DISPLAY_NAMES[data['counter']].lower()})"),
                 coverage=format_percentage(data["coverage"]),
                 threshold=format_percentage(data["threshold"]),
                 delta=format_delta(data["delta"]),
@@ -222,17 +941,60 @@ def write_markdown(
         if len(unmapped_list) > 10:
             lines.append("- ...")
 
+    counter_header = " | ".join(COUNTER_DISPLAY_NAMES[counter] for counter in COUNTER_TYPES)
+    counter_rule = " | ".join("---:" for _ in COUNTER_TYPES)
+    lines.extend(["", "## Counters by Layer", "", f"| Layer | {counter_header} |", f"| --- | {counter_rule} |"])
+    for layer in layer_thresholds:
+        cells = " | ".join(format_optional_percentage(layers.coverage(layer, counter)) for counter in COUNTER_TYPES)
+        lines.append(f"| {LAYER_DISPLAY_NAMES[layer]} | {cells} |")
+
+    measured = [package for package in packages.keys() if sum(packages.pair(package, "LINE")) > 0]
+    if measured:
+        lowest = sorted(measured, key=lambda package: (packages.coverage(package, "LINE"), package))
+        lines.extend(
+            [
+                "",
+                f"## Packages ({min(len(lowest), MARKDOWN_PACKAGE_ROWS)} of {len(lowest)}, lowest line coverage first)",
+                "",
+                f"| Package | {counter_header} |",
+                f"| --- | {counter_rule} |",
+            ]
+        )
+        for package in lowest[:MARKDOWN_PACKAGE_ROWS]:
+            cells = " | ".join(format_optional_percentage(packages.coverage(package, counter)) for counter in COUNTER_TYPES)
+            lines.append(f"| {package or '(default)'} | {cells} |")
+
+    if diff is not None:
+        lines.extend(["", "## Changed Files", "", "| File | Lines | Base | Delta | Branches | Base |", "| --- | ---: | ---: | ---: | ---: | ---: |"])
+        for entry in diff["files"] + [dict(diff, source="**Total**")]:
+            lines.append(
+                "| {source} | {lines} | {base_lines} | {delta} | {branches} | {base_branches} |".format(
+                    source=entry["source"],
+                    lines=format_optional_percentage(entry["lineCoverage"]),
+                    base_lines=format_optional_percentage(entry["baseLineCoverage"]),
+                    delta=format_optional_delta(entry["lineCoverage"], entry["baseLineCoverage"]),
+                    branches=format_optional_percentage(entry["branchCoverage"]),
+                    base_branches=format_optional_percentage(entry["baseBranchCoverage"]),
+                )
+            )
+
     path.parent.mkdir(parents=True, exist_ok=True)
     path.write_text("\n".join(lines) + "\n", encoding="utf-8")
 
 
 def write_json(
     path: Path,
-    xml_path: Path,
+    build_id: str,
+    branch: Optional[str],
+    generated_at: str,
     metrics: Dict[str, Dict[str, float]],
     status_counts: Dict[str, int],
     unmapped: Iterable[str],
     layer_thresholds: Dict[str, float],
+    trend: List[Dict[str, Union[str, float]]],
+    packages: CounterTable,
+    layers: CounterTable,
+    diff: Optional[Dict[str, object]] = None,
 ) -> None:
     machine_metrics = {
         layer.lower().replace("_", ""): {
@@ -240,20 +1002,33 @@ def write_json(
             "threshold": data["threshold"],
             "status": data["status"],
             "delta": round(data["delta"], 2),
+            "counter": data["counter"],
+            "counters": layers.summary(layer),
         }
         for layer, data in metrics.items()
     }
 
     payload = {
-        "buildId": xml_path.stem,
-        "generatedAt": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "buildId": build_id,
+        "generatedAt": generated_at,
         "layers": machine_metrics,
         "thresholds": {
             layer.lower().replace("_", ""): threshold for layer, threshold in layer_thresholds.items()
         },
         "statusBreakdown": status_counts,
         "unmappedClasses": list(unmapped),
+        "trend": trend,
+        "packages": {package: packages.summary(package) for package in sorted(packages.keys())},
     }
+    if branch is not None:
+        payload["branch"] = branch
+    if diff is not None:
+        payload["diffCoverage"] = {
+            "files": [
+                dict(entry, **{key: round_optional(entry[key]) for key in DIFF_COVERAGE_KEYS}) for entry in diff["files"]
+            ],
+            **{key: round_optional(diff[key]) for key in DIFF_COVERAGE_KEYS},
+        }
 
     path.parent.mkdir(parents=True, exist_ok=True)
     path.write_text(json.dumps(payload, indent=2, sort_keys=True) + "\n", encoding="utf-8")
@@ -261,31 +1036,81 @@ def write_json(
 
 def main(argv: Iterable[str]) -> int:
     args = parse_args(list(argv))
-    xml_path = args.jacoco_xml.resolve()
     markdown_path = args.markdown_output.resolve()
     metadata_path = args.coverage_metadata.resolve()
 
-    if not xml_path.exists():
-        print(f"JaCoCo XML report not found: {xml_path}", file=sys.stderr)
+    try:
+        xml_paths = resolve_reports(args.jacoco_xml)
+    except FileNotFoundError as error:
+        print(str(error), file=sys.stderr)
         return 2
 
     try:
-        thresholds = load_thresholds(metadata_path)
-        metrics, status_counts, unmapped = compute_layer_metrics(
-            xml_path, args.layer_map.resolve(), thresholds
+        thresholds, threshold_counters = load_thresholds(metadata_path)
+        classes = collect_class_counters(xml_paths, args.jobs)
+        metrics, status_counts, unmapped, packages, layers = compute_layer_metrics(
+            classes, args.layer_map.resolve(), thresholds, threshold_counters
         )
     except FileNotFoundError as error:
         print(str(error), file=sys.stderr)
         return 3
 
-    write_markdown(markdown_path, xml_path, metrics, status_counts, unmapped, thresholds)
+    if args.snapshot_output is not None:
+        write_snapshot(args.snapshot_output.resolve(), classes)
+
+    diff = None
+    if args.diff_ref is not None or args.changed_files is not None:
+        try:
+            changed = list_changed_files(args.diff_ref, args.changed_files)
+            base = CoverageSnapshot(args.diff_base.resolve()) if args.diff_base is not None else None
+        except (OSError, ValueError, subprocess.CalledProcessError) as error:
+            print(f"[coverage] cannot compute diff coverage: {getattr(error, 'stderr', None) or error}", file=sys.stderr)
+            return 2
+        try:
+            diff = compute_diff_coverage(changed, classes, base)
+        finally:
+            if base is not None:
+                base.close()
+
+    build_id = args.build_id or (default_build_id() if args.history_db is not None else xml_paths[0].stem)
+    generated_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    trend: List[Dict[str, Union[str, float]]] = []
+    if args.history_db is not None:
+        history = CoverageHistory(args.history_db.resolve())
+        try:
+            history.record(build_id, args.branch, generated_at, metrics, packages)
+            trend = history.trend(args.branch, args.trend_builds)
+        finally:
+            history.close()
+
+    write_markdown(markdown_path, xml_paths, metrics, status_counts, unmapped, thresholds, packages, layers, diff)
 
     if args.json_output is not None:
         write_json(
-            args.json_output.resolve(), xml_path, metrics, status_counts, unmapped, thresholds
+            args.json_output.resolve(),
+            build_id,
+            args.branch,
+            generated_at,
+            metrics,
+            status_counts,
+            unmapped,
+            thresholds,
+            trend,
+            packages,
+            layers,
+            diff,
         )
 
     print(f"Coverage summary written to {markdown_path}")
+    if diff is not None and args.diff_min_coverage is not None:
+        coverage = diff["lineCoverage"]
+        if coverage is not None and coverage < args.diff_min_coverage:
+            print(
+                f"[coverage] changed files cover {format_percentage(coverage)} of their lines, "
+                f"below the {format_percentage(args.diff_min_coverage)} target",
+                file=sys.stderr,
+            )
+            return EXIT_DIFF_BELOW_TARGET
     return 0
 
 
@@ -0,0 +1,153 @@
+"""Tests for scripts/coverage/generate-summary.py, run with `python -m pytest scripts/tests`."""
+
+import importlib.util
+import itertools
+import re
+from pathlib import Path
+
+import pytest
+
+SCRIPT = Path(__file__).resolve().parents[1] / "coverage" / "generate-summary.py"
+LAYER_MAP = Path(__file__).resolve().parents[2] / "config" / "testing" / "coverage" / "layer-map.json"
+
+
+@pytest.fixture(scope="module")
+def summary():
+    spec = importlib.util.spec_from_file_location("generate_summary", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def classify_layer(class_name, patterns, default_layer):
+    """The original linear scan that LayerClassifier must agree with."""
+    normalized = class_name.replace(".", "/")
+    for layer, compiled_list in patterns:
+        for regex in compiled_list:
+            if regex.search(normalized):
+                return layer
+    return default_layer
+
+
+PATTERNS = {
+    "anchored": ["^com/example/feature/.*/ui/.*$", "^com/example/MainActivity.*$"],
+    "escaped": [r"^com/example/data\.internal/.*$", r"^com/example/Foo\$Companion$", r"^com/example/a\.b.*$"],
+    "quantified": ["^com/examples?/model/.*$", "^com/ex{1,2}ample/net/.*$", "^com/example/x*y/.*$", "^com/exam[a-z]le/db/.*$"],
+    "alternation": ["^com/example/(ui|view)/.*$", "^com/example/repo/.*$|Dao$", "^(com|org)/example/core/.*$"],
+    "ignorecase": ["(?i)^COM/EXAMPLE/SETTINGS/.*$", "(?i)^com/Example/Ui/.*$"],
+    "unanchored": ["/presentation/", "ViewModel$", r"\$inner\d+$", "Impl"],
+}
+
+CLASS_NAMES = [
+    "com/example/feature/chat/ui/ChatScreen",
+    "com/example/feature/chat/ui/ChatScreen$Content$1",
+    "com/example/feature/chat/data/ChatRepository",
+    "com/example/MainActivity",
+    "com/example/MainActivity$onCreate$1",
+    "com/example/Main",
+    "com/example/data.internal/Cache",
+    "com/example/dataXinternal/Cache",
+    "com/example/Foo$Companion",
+    "com/example/Foo",
+    "com/example/a.b/Thing",
+    "com/example/aXb/Thing",
+    "com/examples/model/User",
+    "com/example/model/User$Builder",
+    "com/exxample/net/Client",
+    "com/example/y/Z",
+    "com/example/xxy/Z",
+    "com/examqle/db/Db",
+    "com/example/ui/Button",
+    "com/example/view/Button$inner2",
+    "com/example/repo/UserRepo",
+    "org/example/storage/UserDao",
+    "org/example/core/Clock",
+    "com/example/settings/Prefs",
+    "com/example/Ui/Widget",
+    "com/example/feature/home/presentation/HomeViewModel",
+    "com/example/feature/home/presentation/HomeViewModel$state$1",
+    "com/example/network/ApiImpl",
+    "Toplevel",
+    "com.example.feature.chat.ui.Dotted",
+]
+
+
+@pytest.mark.parametrize(
+    "groups",
+    [[name] for name in PATTERNS] + [list(PATTERNS)],
+    ids=[*PATTERNS, "all"],
+)
+def test_layer_classifier_matches_linear_scan(summary, groups):
+    expressions = list(itertools.chain.from_iterable(PATTERNS[group] for group in groups))
+    patterns = tuple(
+        (f"LAYER_{index}", (re.compile(expression),)) for index, expression in enumerate(expressions)
+    )
+    classifier = summary.LayerClassifier(patterns, "DEFAULT")
+
+    for class_name in CLASS_NAMES * 2:
+        assert classifier.classify(class_name) == classify_layer(class_name, patterns, "DEFAULT"), class_name
+
+
+def test_layer_classifier_matches_linear_scan_on_layer_map(summary):
+    patterns, default_layer = summary.load_layer_map(LAYER_MAP)
+    classifier = summary.LayerClassifier(patterns, default_layer)
+    names = [
+        f"com/vjaykrsna/nanoai/{package}/{name}"
+        for package in ("feature/chat/ui", "feature/chat/presentation", "feature/library/data", "core/domain",
+                        "core/data/db", "shared/model", "shared/ui", "coverage/tasks", "inference", "other")
+        for name in ("Thing", "Thing$1", "Thing$inner$2")
+    ] + ["com/vjaykrsna/nanoai/MainActivity", "com/vjaykrsna/nanoai/MainActivity$1", "com/vjaykrsna/nanoai/NanoAIApplication"]
+
+    for class_name in names:
+        assert classifier.classify(class_name) == classify_layer(class_name, patterns, default_layer), class_name
+
+
+@pytest.mark.parametrize(
+    "expression, prefix",
+    [
+        ("^com/example/.*$", "com/example/"),
+        (r"^com/example\.data/.*$", "com/example.data/"),
+        (r"^com/\d+/.*$", "com/"),
+        ("^com/examples?/.*$", "com/example"),
+        ("^com/ex{1,2}ample/.*$", "com/e"),
+        ("^com/x*y$", "com/"),
+        ("^com/(ui|view)/.*$", None),
+        ("^com/a|^org/b", None),
+        ("com/example/", None),
+    ],
+)
+def test_literal_prefix(summary, expression, prefix):
+    assert summary.literal_prefix(expression) == prefix
+
+
+def test_snapshot_round_trip_and_truncation(summary, tmp_path):
+    classes = summary.ClassCoverage()
+    counts = [0] * summary.CounterTable.WIDTH
+    for class_name, source, line, branch in [
+        ("com/example/Foo", "com/example/Foo.kt", (3, 1), (2, 2)),
+        ("com/example/Foo$1", "com/example/Foo.kt", (1, 0), (0, 0)),
+        ("com/example/Bar", "com/example/Bar.kt", (0, 5), (0, 4)),
+    ]:
+        line_index = 2 * summary.COUNTER_INDEX["LINE"]
+        branch_index = 2 * summary.COUNTER_INDEX["BRANCH"]
+        counts[line_index : line_index + 2] = line
+        counts[branch_index : branch_index + 2] = branch
+        classes.put_class(class_name, source, counts)
+    path = tmp_path / "base.snap"
+    summary.write_snapshot(path, classes)
+
+    snapshot = summary.CoverageSnapshot(path)
+    try:
+        assert snapshot.classes("com/example/Foo.kt") == [
+            ("com/example/Foo", ("com/example/Foo.kt", 3, 1, 2, 2)),
+            ("com/example/Foo$1", ("com/example/Foo.kt", 1, 0, 0, 0)),
+        ]
+        assert snapshot.classes("com/example/Missing.kt") == []
+    finally:
+        snapshot.close()
+
+    data = path.read_bytes()
+    for size in (len(data) - 4, 20, 4):
+        path.write_bytes(data[:size])
+        with pytest.raises(ValueError):
+            summary.CoverageSnapshot(path)
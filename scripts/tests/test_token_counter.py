@@ -0,0 +1,67 @@
+"""Tests for scripts/token_counter.py, run with `python -m pytest scripts/tests`."""
+
+import importlib.util
+import io
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("tokenizers")
+from tokenizers import Tokenizer, models, pre_tokenizers, trainers  # noqa: E402
+
+SCRIPT = Path(__file__).resolve().parents[1] / "token_counter.py"
+
+
+@pytest.fixture(scope="module")
+def token_counter():
+    spec = importlib.util.spec_from_file_location("token_counter", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["token_counter"] = module
+    spec.loader.exec_module(module)
+    yield module
+    del sys.modules["token_counter"]
+
+
+WORDS = ["fun", "val", "class", "return", "import", "package", "override", "data", "String", "Int"]
+
+
+def sample_text(lines: int) -> str:
+    rng = random.Random(7)
+    return "".join(
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 8))) + rng.choice(["\n", "\n", " {\n", "()\n"])
+        for _ in range(lines)
+    )
+
+
+def train_tokenizer(path: Path, pre_tokenizer) -> str:
+    tokenizer = Tokenizer(models.BPE(unk_token="<unk>"))
+    tokenizer.pre_tokenizer = pre_tokenizer
+    alphabet = pre_tokenizers.ByteLevel.alphabet() if isinstance(pre_tokenizer, pre_tokenizers.ByteLevel) else []
+    trainer = trainers.BpeTrainer(vocab_size=300, special_tokens=["<unk>"], initial_alphabet=alphabet)
+    tokenizer.train_from_iterator(sample_text(200).splitlines(), trainer)
+    tokenizer.save(str(path))
+    return str(path)
+
+
+@pytest.mark.parametrize(
+    "pre_tokenizer",
+    [pre_tokenizers.ByteLevel(add_prefix_space=False), pre_tokenizers.Metaspace()],
+    ids=["byte-level", "metaspace"],
+)
+def test_streamed_counts_match_whole_file(token_counter, tmp_path, monkeypatch, pre_tokenizer):
+    spec = train_tokenizer(tmp_path / "tokenizer.json", pre_tokenizer)
+    token_counter.configure_tokenizers([("test", spec)])
+    monkeypatch.setattr(token_counter, "STREAM_CHUNK_CHARS", 512)
+    text = sample_text(2000)
+
+    assert token_counter.count_tokens_streaming(io.StringIO(text)) == token_counter.count_tokens(text)
+
+
+def test_only_gpt2_style_tokenizers_stream(token_counter, tmp_path):
+    byte_level = train_tokenizer(tmp_path / "byte-level.json", pre_tokenizers.ByteLevel(add_prefix_space=False))
+    metaspace = train_tokenizer(tmp_path / "metaspace.json", pre_tokenizers.Metaspace())
+
+    assert token_counter.LoadedTokenizer(byte_level).splits_like_gpt2()
+    assert not token_counter.LoadedTokenizer(metaspace).splits_like_gpt2()
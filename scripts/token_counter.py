@@ -4,37 +4,199 @@
 # requires-python = ">=3.10"
 # dependencies = [
 #   "gitpython",
-#   "tqdm",
 #   "transformers",
+#   "tokenizers",
 #   "rich",
-#   "pathspec",
+#   "pathspec>=0.12",
+#   "watchdog",
 # ]
 # ///
 
+import argparse
+import csv
+import hashlib
+import io
+import json
+import math
+import mmap
 import os
+import queue
+import random
+import re
 import sys
 import shutil
+import signal
+import socketserver
+import sqlite3
+import stat
+import subprocess
 import tempfile
+import threading
+import time
 import warnings
 from pathlib import Path
-from typing import Dict, List, Tuple
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, AsyncIterator, BinaryIO, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple, Union
 
 # Set environment variable to suppress transformers warnings
 os.environ['TRANSFORMERS_VERBOSITY'] = 'error'
 
-from git import Repo
-from tqdm import tqdm
-from transformers import AutoTokenizer
-from rich.console import Console
-from rich.table import Table
-from rich.progress import track
-from rich import print as rprint
-import pathspec
+# Heavy dependencies (git, transformers, rich, pathspec) are imported where they
+# are first needed, so --help, usage errors and small runs start quickly
+if TYPE_CHECKING:
+    import pathspec
+    from git import Repo
 
-# Initialize the console and tokenizer
 warnings.filterwarnings('ignore')
-console = Console()
-tokenizer = AutoTokenizer.from_pretrained("gpt2")
+
+class _LazyConsole:
+    """Stand-in for a rich Console that imports rich on first use."""
+
+    _console = None
+
+    def __getattr__(self, name):
+        if _LazyConsole._console is None:
+            from rich.console import Console
+            _LazyConsole._console = Console()
+        return getattr(_LazyConsole._console, name)
+
+console = _LazyConsole()
+
+def track(sequence: Iterable, description: str, total: Optional[int] = None) -> Iterable:
+    """Wrap an iterable in a rich progress bar, or a running count when its length is unknown."""
+    from rich.progress import track as rich_track
+    if total is None and not hasattr(sequence, '__len__'):
+        return _track_unsized(sequence, description)
+    return rich_track(sequence, description=description, total=total)
+
+def _track_unsized(sequence: Iterable, description: str) -> Iterator:
+    """Show a spinner with the number of items seen so far."""
+    from rich.progress import MofNCompleteColumn, Progress, SpinnerColumn, TextColumn, TimeElapsedColumn
+
+    with Progress(SpinnerColumn(), TextColumn("[progress.description]{task.description}"), MofNCompleteColumn(), TimeElapsedColumn()) as progress:
+        task = progress.add_task(description, total=None)
+        for item in sequence:
+            yield item
+            progress.advance(task)
+
+class Profiler:
+    """Wall and CPU time, volume and call counts per phase, plus per-file timings, for --profile.
+
+    Phases may run concurrently in pipeline threads; CPU time is measured per
+    Python thread, so it adds up across them but misses the tokenizer's own
+    native threads. Worker processes keep their own profiler and hand it back
+    with each chunk of results to be merged.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.started_cpu = time.process_time()
+        self._lock = threading.Lock()
+        # phase -> [wall seconds, CPU seconds, volume, calls]
+        self.phases: Dict[str, List[float]] = {}
+        # path -> [seconds, bytes]
+        self.files: Dict[str, List[float]] = {}
+        # worker pid -> (CPU seconds, peak RSS bytes), as last reported
+        self.workers: Dict[int, Tuple[float, int]] = {}
+
+    @contextmanager
+    def phase(self, name: str, volume: int = 0) -> Iterator[None]:
+        """Time a block of work as part of a phase."""
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - wall, time.thread_time() - cpu, volume)
+
+    def record(self, name: str, wall: float, cpu: float, volume: int = 0, calls: int = 1) -> None:
+        with self._lock:
+            stats = self.phases.setdefault(name, [0.0, 0.0, 0, 0])
+            stats[0] += wall
+            stats[1] += cpu
+            stats[2] += volume
+            stats[3] += calls
+
+    def add_volume(self, name: str, volume: int) -> None:
+        self.record(name, 0.0, 0.0, volume, calls=0)
+
+    def add_file(self, path: str, seconds: float = 0.0, size: Optional[int] = None) -> None:
+        """Charge time (and, once known, the size) to a file."""
+        with self._lock:
+            stats = self.files.setdefault(path, [0.0, 0])
+            stats[0] += seconds
+            if size is not None:
+                stats[1] = size
+
+    def snapshot(self) -> tuple:
+        """This process's phases, files and resource usage, for merging into the parent's profile."""
+        return os.getpid(), time.process_time(), _peak_rss(), self.phases, self.files
+
+    def merge(self, snapshot: tuple) -> None:
+        """Add a worker's snapshot to this profile."""
+        pid, cpu, rss, phases, files = snapshot
+        with self._lock:
+            self.workers[pid] = (cpu, rss)
+        for name, (wall, cpu_seconds, volume, calls) in phases.items():
+            self.record(name, wall, cpu_seconds, volume, calls)
+        for path, (seconds, size) in files.items():
+            self.add_file(path, seconds, size or None)
+
+    def iter_phase(self, name: str, iterable: Iterable) -> Iterator:
+        """Charge the time spent producing each item of iterable to a phase."""
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def report(self, total_tokens: int, root: str, top: int = 10) -> Dict[str, object]:
+        """Summarize the run as a JSON-ready dict, with file paths relative to root."""
+        wall = time.perf_counter() - self.started
+        children = os.times()
+        child_cpu = children.children_user + children.children_system + sum(cpu for cpu, _ in self.workers.values())
+        child_rss = max([_peak_rss(children=True)] + [rss for _, rss in self.workers.values()])
+        files = [{'path': os.path.relpath(path, root), 'seconds': round(seconds, 6), 'bytes': size} for path, (seconds, size) in self.files.items()]
+        read_bytes = self.phases.get('read', [0, 0, 0, 0])[2] + self.phases.get('stream', [0, 0, 0, 0])[2]
+        return {
+            'timestamp': round(time.time(), 3),
+            'wallSeconds': round(wall, 6),
+            'cpuSeconds': round(time.process_time() - self.started_cpu, 6),
+            'childCpuSeconds': round(child_cpu, 6),
+            'peakRssBytes': _peak_rss(),
+            'peakChildRssBytes': child_rss,
+            'files': len(self.files),
+            'bytes': read_bytes,
+            'tokens': total_tokens,
+            'filesPerSecond': round(len(self.files) / wall, 3) if wall else 0.0,
+            'bytesPerSecond': round(read_bytes / wall, 3) if wall else 0.0,
+            'tokensPerSecond': round(total_tokens / wall, 3) if wall else 0.0,
+            'phases': {
+                name: {'wallSeconds': round(stats[0], 6), 'cpuSeconds': round(stats[1], 6), 'volume': stats[2], 'calls': stats[3]}
+                for name, stats in self.phases.items()
+            },
+            'slowestFiles': sorted(files, key=lambda f: f['seconds'], reverse=True)[:top],
+            'largestFiles': sorted(files, key=lambda f: f['bytes'], reverse=True)[:top],
+        }
+
+def _peak_rss(children: bool = False) -> int:
+    """Peak resident set size in bytes of this process, or of its largest waited-for child."""
+    import resource
+
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    return usage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+# Active profiler while --profile runs
+_profiler: Optional[Profiler] = None
+
+# Hugging Face Hub id, local tokenizer directory or tokenizer.json file
+TOKENIZER_NAME = "gpt2"
 
 # File extensions mapped to their technologies
 FILE_EXTENSIONS = {
@@ -210,32 +372,518 @@ FILE_EXTENSIONS = {
 # Set of all text extensions for quick lookup
 TEXT_EXTENSIONS = set(FILE_EXTENSIONS.keys())
 
-def load_gitignore(root_path: Path) -> pathspec.PathSpec:
-    """Load .gitignore patterns from the repository root."""
-    gitignore_path = root_path / '.gitignore'
-    if gitignore_path.exists():
-        with open(gitignore_path, 'r', encoding='utf-8') as f:
-            patterns = f.read().splitlines()
-        return pathspec.PathSpec.from_lines('gitwildmatch', patterns)
-    return pathspec.PathSpec.from_lines('gitwildmatch', [])
-
-def should_ignore(file_path: Path, spec: pathspec.PathSpec, root_path: Path) -> bool:
-    """Check if file should be ignored based on .gitignore."""
-    relative_path = file_path.relative_to(root_path)
-    return spec.match_file(str(relative_path))
-
-def is_binary(file_path: str) -> bool:
-    """Check if a file is binary."""
+# Context windows of the latest models (2025) and the tokenizer family each one
+# counts in. Rows use the --tokenizer labelled with that family (for example
+# anthropic=<spec>) when one is given, and the first tokenizer otherwise.
+CONTEXT_WINDOWS = {
+    # OpenAI Models
+    "GPT-5 Codex": (400000, "openai"),
+    "GPT-4o": (128000, "openai"),
+
+    # Google Models
+    "Gemini 2.5 Pro": (1000000, "google"),
+
+    # xAI Models
+    "Grok 4 Fast": (2000000, "xai"),
+    "Grok Code Fast": (256000, "xai"),
+
+    # Anthropic Models
+    "Claude Sonnet 4.5": (200000, "anthropic"),
+    "Claude Haiku 4.5": (200000, "anthropic"),
+
+    # Open Source Models
+    "Qwen 3 Coder": (256000, "qwen"),
+    "GLM 4.6": (200000, "glm"),
+    "DeepSeek 3.2": (128000, "deepseek"),
+}
+
+class GitignoreMatcher:
+    """Layered .gitignore matching for a directory tree.
+
+    Rules come from .git/info/exclude, the root .gitignore and any nested
+    .gitignore files; deeper files take precedence, as in git. Compiled specs
+    are cached per directory and reused until the .gitignore file changes.
+    """
+
+    def __init__(self, root_path: str):
+        self.root_path = root_path
+        self._specs: Dict[str, Tuple[int, 'pathspec.GitIgnoreSpec']] = {}
+
+    def _load(self, path: str) -> Optional['pathspec.GitIgnoreSpec']:
+        """Compile the ignore file at path, or return None if there is none."""
+        import pathspec
+
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            self._specs.pop(path, None)
+            return None
+        cached = self._specs.get(path)
+        if cached is not None and cached[0] == mtime_ns:
+            return cached[1]
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            spec = pathspec.GitIgnoreSpec.from_lines(f.read().splitlines())
+        self._specs[path] = (mtime_ns, spec)
+        return spec
+
+    def root_chain(self) -> Tuple[Tuple[str, 'pathspec.GitIgnoreSpec'], ...]:
+        """Rules that apply at the root directory, lowest precedence first."""
+        chain = ()
+        exclude = self._load(os.path.join(self.root_path, '.git', 'info', 'exclude'))
+        if exclude is not None:
+            chain += (('', exclude),)
+        return self.chain_for(chain, '')
+
+    def chain_for(self, parent_chain: Tuple[Tuple[str, 'pathspec.GitIgnoreSpec'], ...], relative_dir: str) -> Tuple[Tuple[str, 'pathspec.GitIgnoreSpec'], ...]:
+        """Extend a parent directory's rules with the .gitignore of relative_dir, if any."""
+        spec = self._load(os.path.join(self.root_path, relative_dir, '.gitignore'))
+        if spec is None:
+            return parent_chain
+        return parent_chain + ((relative_dir, spec),)
+
+    def chain_at(self, relative_dir: str) -> Tuple[Tuple[str, 'pathspec.GitIgnoreSpec'], ...]:
+        """Rules that apply inside relative_dir, lowest precedence first."""
+        chain = self.root_chain()
+        if relative_dir:
+            parts = relative_dir.split('/')
+            for depth in range(1, len(parts) + 1):
+                chain = self.chain_for(chain, '/'.join(parts[:depth]))
+        return chain
+
+    def is_path_ignored(self, relative_path: str, is_dir: bool = False) -> bool:
+        """Check a single path the way walk_repository reaches it, including ignored parent directories."""
+        chain = self.root_chain()
+        parts = relative_path.split('/')
+        for depth in range(1, len(parts)):
+            relative_dir = '/'.join(parts[:depth])
+            if parts[depth - 1] == '.git' or self.is_ignored(chain, relative_dir, True):
+                return True
+            chain = self.chain_for(chain, relative_dir)
+        if is_dir and parts[-1] == '.git':
+            return True
+        return self.is_ignored(chain, relative_path, is_dir)
+
+    @staticmethod
+    def is_ignored(chain: Tuple[Tuple[str, 'pathspec.GitIgnoreSpec'], ...], relative_path: str, is_dir: bool) -> bool:
+        """Check a path against a directory's rules; the deepest matching rule wins."""
+        for base, spec in reversed(chain):
+            path = relative_path[len(base) + 1:] if base else relative_path
+            result = spec.check_file(path + '/' if is_dir else path)
+            if result.include is not None:
+                return result.include
+        return False
+
+def walk_repository(repo_path: str, matcher: Optional[GitignoreMatcher] = None, start: str = '', directories: Optional[List[str]] = None) -> Iterator[Tuple[str, str]]:
+    """Yield (file_path, relative_path) for files that are not ignored.
+
+    Ignored directories (and .git) are pruned before descending, so their
+    contents are never listed. Files come in the same order as os.walk.
+    start limits the walk to one (not ignored) directory below repo_path,
+    and every directory walked is appended to directories if given.
+    """
+    matcher = matcher or GitignoreMatcher(repo_path)
+    root = os.path.join(repo_path, *start.split('/')) if start else repo_path
+    stack = [(root, start, matcher.chain_at(start))]
+    while stack:
+        directory, relative_dir, chain = stack.pop()
+        subdirs = []
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+        if directories is not None:
+            directories.append(directory)
+        for entry in entries:
+            relative_path = f"{relative_dir}/{entry.name}" if relative_dir else entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name != '.git' and not matcher.is_ignored(chain, relative_path, True):
+                        subdirs.append((entry.path, relative_path))
+                    continue
+                if not entry.is_file():
+                    continue
+            except OSError:
+                continue
+            if not matcher.is_ignored(chain, relative_path, False):
+                yield entry.path, relative_path
+        for path, relative_path in reversed(subdirs):
+            stack.append((path, relative_path, matcher.chain_for(chain, relative_path)))
+
+# Like git, content with a NUL byte in its first 8000 bytes is binary
+BINARY_SNIFF_BYTES = 8000
+
+# Files above this size are decoded straight from an mmap instead of a read() copy
+MMAP_THRESHOLD = 256 * 1024
+
+# Text that is not valid UTF-8 is decoded as latin-1, which accepts any byte
+TEXT_ENCODINGS = ('utf-8', 'latin-1')
+
+def is_binary_bytes(data) -> bool:
+    """Check if raw file content (bytes or mmap) is binary by sniffing for NUL bytes."""
+    return data.find(b'\0', 0, BINARY_SNIFF_BYTES) != -1
+
+def decode_text(data) -> str:
+    """Decode raw text content with the same newline translation as open() in text mode."""
     try:
-        with open(file_path, 'tr') as check_file:
-            check_file.read(1024)
-            return False
+        content = str(data, 'utf-8')
     except UnicodeDecodeError:
-        return True
+        content = str(data, 'latin-1')
+    if '\r' in content:
+        content = content.replace('\r\n', '\n').replace('\r', '\n')
+    return content
+
+# Token counts for one piece of content, one entry per configured tokenizer
+Counts = Tuple[int, ...]
+
+def add_counts(a: Counts, b: Counts, sign: int = 1) -> Counts:
+    """Add (or with sign=-1, subtract) two per-tokenizer counts."""
+    return tuple(x + sign * y for x, y in zip(a, b))
+
+class LoadedTokenizer:
+    """A loaded tokenizer, exposing only the counting operations the script needs."""
+
+    def __init__(self, spec: str, offline: bool = False):
+        self.spec = spec
+        self.hf = None
+        self._splits_like_gpt2: Optional[bool] = None
+        if Path(spec).is_file():
+            # A standalone tokenizer.json only needs the Rust tokenizers package
+            from tokenizers import Tokenizer
+            self.backend = Tokenizer.from_file(spec)
+            return
+        from transformers import AutoTokenizer
+        try:
+            # Prefer the local cache so a warm start never touches the network
+            self.hf = AutoTokenizer.from_pretrained(spec, local_files_only=True)
+        except OSError:
+            if offline:
+                raise
+            self.hf = AutoTokenizer.from_pretrained(spec)
+        self.backend = getattr(self.hf, 'backend_tokenizer', None)
+
+    def count(self, content: str, add_special_tokens: bool = True) -> int:
+        """Count tokens in a single string."""
+        if self.hf is not None:
+            return len(self.hf.encode(content, add_special_tokens=add_special_tokens))
+        return len(self.backend.encode(content, add_special_tokens=add_special_tokens))
+
+    def splits_like_gpt2(self) -> bool:
+        """Check for GPT-2's byte-level pre-tokenizer, whose splits _SAFE_BOUNDARY relies on."""
+        if self._splits_like_gpt2 is None:
+            self._splits_like_gpt2 = False
+            if self.backend is not None:
+                config = json.loads(self.backend.to_str())
+                pre_tokenizer = config.get('pre_tokenizer') or {}
+                self._splits_like_gpt2 = (
+                    config.get('normalizer') is None
+                    and pre_tokenizer.get('type') == 'ByteLevel'
+                    and pre_tokenizer.get('use_regex', True)
+                    and not pre_tokenizer.get('add_prefix_space', False)
+                )
+        return self._splits_like_gpt2
+
+    def count_batch(self, contents: List[str]) -> List[int]:
+        """Count tokens for many strings in one call, using the fast batch encoder when available."""
+        if self.backend is None or len(contents) < 2:
+            return [self.count(content) for content in contents]
+        return [len(encoding) for encoding in self.backend.encode_batch(contents)]
+
+def parse_tokenizer_arg(value: str) -> Tuple[str, str]:
+    """Split a --tokenizer value of the form [LABEL=]SPEC into (label, spec)."""
+    label, sep, spec = value.partition('=')
+    if sep and label and spec:
+        return label, spec
+    return value, value
+
+_tokenizer_specs: List[Tuple[str, str]] = [(TOKENIZER_NAME, TOKENIZER_NAME)]
+_tokenizer_offline = False
+_tokenizers: Optional[List[LoadedTokenizer]] = None
+
+def configure_tokenizers(specs: List[Tuple[str, str]], offline: bool = False) -> None:
+    """Select the (label, spec) tokenizers to load on first use."""
+    global _tokenizer_specs, _tokenizer_offline, _tokenizers
+    if offline:
+        os.environ['HF_HUB_OFFLINE'] = '1'
+    if _tokenizers is not None and [t.spec for t in _tokenizers] != [spec for _, spec in specs]:
+        _tokenizers = None
+    _tokenizer_specs = list(specs)
+    _tokenizer_offline = offline
+
+def tokenizer_labels() -> List[str]:
+    """Labels of the configured tokenizers, in counting order."""
+    return [label for label, _ in _tokenizer_specs]
+
+def get_tokenizers() -> List[LoadedTokenizer]:
+    """Return the configured tokenizers, loading them on first use."""
+    global _tokenizers
+    if _tokenizers is None:
+        _tokenizers = [LoadedTokenizer(spec, _tokenizer_offline) for _, spec in _tokenizer_specs]
+    return _tokenizers
+
+def zero_counts() -> Counts:
+    """Counts of zero for every configured tokenizer."""
+    return (0,) * len(_tokenizer_specs)
+
+def count_tokens(content: str, add_special_tokens: bool = True) -> Counts:
+    """Count tokens in the given content with every configured tokenizer."""
+    return tuple(t.count(content, add_special_tokens) for t in get_tokenizers())
+
+# Small files are encoded together, up to this many files or characters per batch call
+BATCH_MAX_FILES = 256
+BATCH_MAX_CHARS = 1024 * 1024
+
+def count_tokens_batch(contents: List[str]) -> List[Counts]:
+    """Count tokens for many contents in one call per tokenizer."""
+    if not contents:
+        return []
+    if _profiler is not None:
+        with _profiler.phase('encode', sum(len(content) for content in contents)):
+            return list(zip(*(t.count_batch(contents) for t in get_tokenizers())))
+    return list(zip(*(t.count_batch(contents) for t in get_tokenizers())))
+
+def iter_batches(contents: Iterable[str]) -> Iterator[List[str]]:
+    """Group contents into batches bounded by BATCH_MAX_FILES and BATCH_MAX_CHARS."""
+    batch = []
+    batch_chars = 0
+    for content in contents:
+        batch.append(content)
+        batch_chars += len(content)
+        if len(batch) >= BATCH_MAX_FILES or batch_chars >= BATCH_MAX_CHARS:
+            yield batch
+            batch = []
+            batch_chars = 0
+    if batch:
+        yield batch
+
+# Files above this size are tokenized in chunks instead of being read whole
+STREAM_THRESHOLD = 1024 * 1024
+STREAM_CHUNK_CHARS = 64 * 1024
+# Give up looking for a safe boundary once the buffer grows this large
+STREAM_MAX_BUFFER_CHARS = 8 * STREAM_CHUNK_CHARS
+
+# Cut points the GPT-2 pre-tokenizer never merges across: a newline between two
+# non-whitespace characters ("x\n|foo"), or before a single space that
+# separates two non-whitespace characters ("x| foo")
+_SAFE_BOUNDARY = re.compile(r'(?<=\S\n)(?=\S)|(?<=\S)(?= \S)')
+_SAFE_BOUNDARY_WINDOW = 8 * 1024
+
+def last_safe_boundary(buffer: str) -> int:
+    """Return the last index where buffer can be split without changing its token count, or -1."""
+    for start in (max(0, len(buffer) - _SAFE_BOUNDARY_WINDOW), 0):
+        last = -1
+        for match in _SAFE_BOUNDARY.finditer(buffer, start):
+            last = match.start()
+        if last > 0 or start == 0:
+            return last
+    return -1
+
+def count_tokens_streaming(f, hasher=None) -> Counts:
+    """Count tokens from a text stream in bounded memory, encoding one chunk at a time.
+
+    Chunking is only exact for GPT-2 style pre-tokenizers; with any other
+    tokenizer configured the whole text is read and encoded at once. The
+    text is also fed to hasher, if given, so the same read yields its digest.
+    """
+    if not all(t.splits_like_gpt2() for t in get_tokenizers()):
+        content = f.read()
+        if hasher is not None:
+            hasher.update(content.encode('utf-8', 'surrogatepass'))
+        return count_tokens(content)
+    # Special tokens (if any) are added once for the whole document
+    total = count_tokens('')
+    buffer = ''
+    while True:
+        chunk = f.read(STREAM_CHUNK_CHARS)
+        if not chunk:
+            break
+        if hasher is not None:
+            hasher.update(chunk.encode('utf-8', 'surrogatepass'))
+        buffer += chunk
+        cut = last_safe_boundary(buffer)
+        if cut <= 0:
+            if len(buffer) < STREAM_MAX_BUFFER_CHARS:
+                continue
+            # No whitespace at all (e.g. base64 blobs); a hard cut may shift the count slightly
+            cut = len(buffer)
+        total = add_counts(total, count_tokens(buffer[:cut], add_special_tokens=False))
+        buffer = buffer[cut:]
+    if buffer:
+        total = add_counts(total, count_tokens(buffer, add_special_tokens=False))
+    return total
+
+def content_hasher() -> 'hashlib._Hash':
+    """A fresh hasher producing the digests used to key content."""
+    return hashlib.blake2b(digest_size=16)
+
+def stream_digest(f) -> bytes:
+    """Hash a text stream chunk by chunk; equals content_digest of the whole content."""
+    hasher = content_hasher()
+    while True:
+        chunk = f.read(STREAM_CHUNK_CHARS)
+        if not chunk:
+            return hasher.digest()
+        hasher.update(chunk.encode('utf-8', 'surrogatepass'))
+
+def tokenizer_identity(spec: str) -> str:
+    """Identify a tokenizer without loading it, used to key cached counts."""
+    path = Path(spec)
+    if path.is_dir():
+        path = path / 'tokenizer.json'
+    if path.is_file():
+        return f"file:{hashlib.blake2b(path.read_bytes(), digest_size=16).hexdigest()}"
+    return f"hub:{spec}"
+
+def content_digest(content: str) -> bytes:
+    """Hash decoded file content for the token cache."""
+    hasher = content_hasher()
+    hasher.update(content.encode('utf-8', 'surrogatepass'))
+    return hasher.digest()
+
+def default_cache_dir() -> Path:
+    """Return the per-user cache directory, following XDG_CACHE_HOME."""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(Path.home(), '.cache')
+    return Path(base) / 'token-counter'
+
+DEFAULT_CACHE_MAX_ENTRIES = 500_000
+
+class TokenCache:
+    """Persistent SQLite cache of token counts keyed by content hash and tokenizer identity.
+
+    A second table maps file paths to the digest last seen at a given size and
+    mtime, so unchanged files are answered from a stat() alone, and a third maps
+    git blob IDs to the digest of their content. All tables are trimmed to
+    ``max_entries`` rows, least recently used first.
+    """
+
+    def __init__(self, cache_dir: Path, tokenizer_ids: List[str], max_entries: int = DEFAULT_CACHE_MAX_ENTRIES, read_only: bool = False):
+        self.path = cache_dir / 'tokens.sqlite3'
+        self.tokenizer_ids = list(tokenizer_ids)
+        self.max_entries = max_entries
+        self.read_only = read_only
+        self.now = int(time.time())
+        # Lookups may come from a pipeline thread while the main thread stores results
+        self._lock = threading.RLock()
+        if read_only:
+            self.db = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            return
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS tokens ("
+            "tokenizer TEXT NOT NULL, digest BLOB NOT NULL, tokens INTEGER NOT NULL, "
+            "last_used INTEGER NOT NULL, PRIMARY KEY (tokenizer, digest))"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, "
+            "digest BLOB NOT NULL, last_used INTEGER NOT NULL)"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            "blob BLOB PRIMARY KEY, digest BLOB NOT NULL, last_used INTEGER NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS tokens_last_used ON tokens (last_used)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS files_last_used ON files (last_used)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS blobs_last_used ON blobs (last_used)")
+        self.db.commit()
+        self._touched_tokens: List[bytes] = []
+        self._touched_files: List[str] = []
+        self._touched_blobs: List[bytes] = []
+
+    def lookup(self, digest: bytes) -> Optional[Counts]:
+        """Return the cached counts for a content digest, if every tokenizer has one."""
+        with self._lock:
+            rows = dict(self.db.execute(
+                f"SELECT tokenizer, tokens FROM tokens WHERE digest = ? AND tokenizer IN ({','.join('?' * len(self.tokenizer_ids))})",
+                (digest, *self.tokenizer_ids),
+            ).fetchall())
+            if len(rows) < len(self.tokenizer_ids):
+                return None
+            if not self.read_only:
+                self._touched_tokens.append(digest)
+        return tuple(rows[tokenizer_id] for tokenizer_id in self.tokenizer_ids)
 
-def count_tokens(content: str) -> int:
-    """Count tokens in the given content using GPT-2 tokenizer."""
-    return len(tokenizer.encode(content))
+    def lookup_file(self, file_path: str, st: os.stat_result) -> Optional[Tuple[bytes, Counts]]:
+        """Return the content digest and cached counts for a file whose size and mtime are unchanged."""
+        with self._lock:
+            row = self.db.execute(
+                "SELECT digest FROM files WHERE path = ? AND size = ? AND mtime_ns = ?",
+                (file_path, st.st_size, st.st_mtime_ns),
+            ).fetchone()
+            if row is None:
+                return None
+            tokens = self.lookup(row[0])
+            if tokens is None:
+                return None
+            if not self.read_only:
+                self._touched_files.append(file_path)
+        return row[0], tokens
+
+    def lookup_blob(self, blob_id: bytes) -> Optional[Tuple[bytes, Counts]]:
+        """Return the content digest and cached counts for a git blob."""
+        with self._lock:
+            try:
+                row = self.db.execute("SELECT digest FROM blobs WHERE blob = ?", (blob_id,)).fetchone()
+            except sqlite3.OperationalError:
+                # A read-only view of a cache written before blobs were recorded
+                return None
+            if row is None:
+                return None
+            tokens = self.lookup(row[0])
+            if tokens is None:
+                return None
+            if not self.read_only:
+                self._touched_blobs.append(blob_id)
+        return row[0], tokens
+
+    def store(self, digest: bytes, tokens: Counts) -> None:
+        """Record the per-tokenizer counts for a content digest."""
+        with self._lock:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO tokens VALUES (?, ?, ?, ?)",
+                ((tokenizer_id, digest, count, self.now) for tokenizer_id, count in zip(self.tokenizer_ids, tokens)),
+            )
+
+    def record_file(self, file_path: str, st: os.stat_result, digest: bytes) -> None:
+        """Remember which content digest a file had at the given size and mtime."""
+        with self._lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                (file_path, st.st_size, st.st_mtime_ns, digest, self.now),
+            )
+
+    def record_blob(self, blob_id: bytes, digest: bytes) -> None:
+        """Remember the content digest of a git blob."""
+        with self._lock:
+            self.db.execute("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?)", (blob_id, digest, self.now))
+
+    def close(self) -> None:
+        """Flush access times, evict least recently used rows and close the database."""
+        if not self.read_only:
+            self.db.executemany(
+                "UPDATE tokens SET last_used = ? WHERE tokenizer = ? AND digest = ?",
+                ((self.now, tokenizer_id, digest) for digest in self._touched_tokens for tokenizer_id in self.tokenizer_ids),
+            )
+            self.db.executemany(
+                "UPDATE files SET last_used = ? WHERE path = ?",
+                ((self.now, file_path) for file_path in self._touched_files),
+            )
+            self.db.executemany(
+                "UPDATE blobs SET last_used = ? WHERE blob = ?",
+                ((self.now, blob_id) for blob_id in self._touched_blobs),
+            )
+            for table in ('tokens', 'files', 'blobs'):
+                (count,) = self.db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()
+                if count > self.max_entries:
+                    self.db.execute(
+                        f"DELETE FROM {table} WHERE rowid IN "
+                        f"(SELECT rowid FROM {table} ORDER BY last_used LIMIT ?)",
+                        (count - self.max_entries,),
+                    )
+            self.db.commit()
+        self.db.close()
 
 def format_number(num: int) -> str:
     """Format a number with thousands separator and appropriate suffix."""
@@ -247,168 +895,1874 @@ def format_number(num: int) -> str:
         return f"{num/1_000:.1f}K"
     return f"{num:,}"
 
-def process_repository(repo_path: str, total_only: bool = False) -> Tuple[int, Dict[str, int], Dict[str, int]]:
-    """Process all files in the repository and count tokens."""
-    total_tokens = 0
+def iter_files(repo_path: str, matcher: Optional[GitignoreMatcher] = None, start: str = '', directories: Optional[List[str]] = None) -> Iterator[Tuple[str, str]]:
+    """Yield candidate files by extension as the walk finds them, honoring .gitignore files.
+
+    Binary files are only weeded out when they are read for counting.
+    """
+    walk = walk_repository(repo_path, matcher, start, directories)
+    if _profiler is not None:
+        walk = _profiler.iter_phase('walk', walk)
+    for file_path, relative_path in walk:
+        extension = os.path.splitext(relative_path)[1].lower()
+        if extension in FILE_EXTENSIONS:
+            yield file_path, extension
+
+def collect_git_files(repo_path: str) -> Tuple[List[Tuple[str, str]], Dict[str, bytes]]:
+    """Collect tracked files from the git index along with their blob IDs.
+
+    Blob IDs are only returned for files whose working-tree copy matches the
+    index, so they can stand in for a content hash. Deleted files are skipped.
+    """
+    from git import Git
+
+    git = Git(repo_path)
+    staged = git.ls_files('--stage', '-z')
+    dirty = set(git.ls_files('--modified', '-z').split('\0'))
+    deleted = set(git.ls_files('--deleted', '-z').split('\0'))
+
+    blob_ids = {}
+    all_files = []
+    for entry in staged.split('\0'):
+        if not entry:
+            continue
+        meta, relative_path = entry.split('\t', 1)
+        mode, blob_id, stage = meta.split(' ')
+        # Skip symlinks, submodules and all but one side of merge conflicts
+        if not mode.startswith('100') or stage not in ('0', '2') or relative_path in deleted:
+            continue
+        extension = os.path.splitext(relative_path)[1].lower()
+        if extension not in FILE_EXTENSIONS:
+            continue
+        file_path = os.path.join(repo_path, relative_path)
+        all_files.append((file_path, extension))
+        if relative_path not in dirty:
+            blob_ids[file_path] = bytes.fromhex(blob_id)
+
+    return all_files, blob_ids
+
+# Items buffered between pipeline stages; a full queue blocks the stage feeding it
+PIPELINE_QUEUE_SIZE = 256
+# Files read ahead of the tokenizer, bounding the decoded content held in memory
+READ_AHEAD_FILES = 64
+
+_PIPELINE_DONE = object()
+
+def iter_background(iterable: Iterable, maxsize: int = PIPELINE_QUEUE_SIZE) -> Iterator:
+    """Run an iterable in a background thread, handing its items over through a bounded queue.
+
+    Exceptions raised by the iterable are re-raised in the consumer. Closing the
+    returned generator stops the producer at its next item.
+    """
+    items = queue.Queue(maxsize)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce() -> None:
+        source = iter(iterable)
+        try:
+            for item in source:
+                if not put((item, None)):
+                    return
+        except BaseException as e:
+            put((_PIPELINE_DONE, e))
+        else:
+            put((_PIPELINE_DONE, None))
+        finally:
+            if hasattr(source, 'close'):
+                source.close()
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is _PIPELINE_DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+        producer.join()
+
+class FileResult(NamedTuple):
+    """Token count for one file; tokens is None when the file is binary or, with error set, could not be read.
+
+    digest identifies the content: a hash of the decoded text, or the git blob
+    ID when a cached blob was never read.
+    """
+    path: str
+    extension: str
+    tokens: Optional[Counts]
+    error: Optional[str] = None
+    digest: Optional[bytes] = None
+    binary: bool = False
+
+# Read-only view of the token cache, opened per worker process
+_worker_cache: Optional[TokenCache] = None
+
+# Counts of content a worker process has encoded, and byte sizes of the large files among it, kept across its chunks
+_worker_known: Dict[bytes, Counts] = {}
+_worker_streamed_sizes: Set[int] = set()
+# Forget them once this many accumulate, bounding a long-lived worker's memory
+WORKER_KNOWN_MAX_ENTRIES = 200_000
+
+def count_large_file(f, file_path: str, extension: str, cache: Optional[TokenCache] = None, known: Optional[Dict[bytes, Counts]] = None) -> FileResult:
+    """Count tokens in a large file opened in binary mode without holding its content or token IDs in memory.
+
+    With known or a cache to consult, the content is hashed in a first pass
+    and not tokenized again if it is already counted. Otherwise it is hashed
+    while it is counted, reading the file only once.
+    """
+    if is_binary_bytes(f.read(BINARY_SNIFF_BYTES)):
+        return FileResult(file_path, extension, None, binary=True)
+    for encoding in TEXT_ENCODINGS:
+        f.seek(0)
+        text = io.TextIOWrapper(f, encoding=encoding, newline=None)
+        try:
+            if known is None and cache is None:
+                hasher = content_hasher()
+                tokens = count_tokens_streaming(text, hasher)
+                return FileResult(file_path, extension, tokens, digest=hasher.digest())
+            digest = stream_digest(text)
+            tokens = known.get(digest) if known is not None else None
+            if tokens is None and cache is not None:
+                tokens = cache.lookup(digest)
+            if tokens is None:
+                text.seek(0)
+                tokens = count_tokens_streaming(text)
+            return FileResult(file_path, extension, tokens, digest=digest)
+        except UnicodeDecodeError:
+            continue
+        finally:
+            # Hand the file back to the caller's with block rather than closing it here
+            text.detach()
+
+def read_for_count(file_path: str, extension: str) -> Union[FileResult, Tuple[str, bytes], BinaryIO]:
+    """Read a file for counting.
+
+    Each file is opened once: binary sniffing and decoding share the same
+    buffer. Returns (content, digest) when the content still needs encoding,
+    a finished FileResult for binary and unreadable files, or, for large
+    files, the still open file for count_large_file to stream.
+    """
+    try:
+        f = open(file_path, 'rb')
+    except OSError as e:
+        return FileResult(file_path, extension, None, str(e))
+    try:
+        size = os.fstat(f.fileno()).st_size
+        if _profiler is not None:
+            _profiler.add_file(file_path, size=size)
+        if size > STREAM_THRESHOLD:
+            return f
+        with f:
+            if size > MMAP_THRESHOLD:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    binary = is_binary_bytes(data)
+                    content = None if binary else decode_text(data)
+            else:
+                data = f.read()
+                binary = is_binary_bytes(data)
+                content = None if binary else decode_text(data)
+    except Exception as e:
+        f.close()
+        return FileResult(file_path, extension, None, str(e))
+    if _profiler is not None:
+        _profiler.add_volume('read', size)
+    if binary:
+        return FileResult(file_path, extension, None, binary=True)
+    return content, content_digest(content)
+
+def _read_profiled(file_path: str, extension: str) -> Union[FileResult, Tuple[str, bytes], BinaryIO]:
+    """read_for_count, charging its time to the read phase and the file."""
+    started = time.perf_counter()
+    with _profiler.phase('read'):
+        item = read_for_count(file_path, extension)
+    _profiler.add_file(file_path, time.perf_counter() - started)
+    return item
+
+def _flush_batch(pending: List[Union[FileResult, Tuple[str, str, bytes, int]]], batch: List[str], known: Dict[bytes, Counts]) -> Iterator[FileResult]:
+    """Encode a batch and yield the pending results in their original order, remembering each content's counts."""
+    started = time.perf_counter()
+    counts = count_tokens_batch(batch)
+    if _profiler is not None and batch:
+        # Share the batch's encode time among its files by length
+        seconds_per_char = (time.perf_counter() - started) / max(1, sum(len(content) for content in batch))
+        for item in pending:
+            if not isinstance(item, FileResult):
+                _profiler.add_file(item[0], seconds_per_char * len(batch[item[3]]))
+    for item in pending:
+        if isinstance(item, FileResult):
+            yield item
+        else:
+            file_path, extension, digest, index = item
+            known[digest] = counts[index]
+            yield FileResult(file_path, extension, counts[index], digest=digest)
+
+def iter_count_files(files: Iterable[Tuple[str, str]], cache: Optional[TokenCache] = None, known: Optional[Dict[bytes, Counts]] = None, streamed_sizes: Optional[Set[int]] = None) -> Iterator[FileResult]:
+    """Count tokens for files in order, encoding small files in batches.
+
+    Reading runs in a background thread a bounded number of files ahead, so
+    disk waits overlap with encoding. Files are keyed by a hash of their
+    content, and identical copies are encoded only once. Counts are
+    remembered in known, and the sizes of streamed files in streamed_sizes,
+    if given, so later calls can reuse them too.
+    """
+    read = read_for_count if _profiler is None else _read_profiled
+    reads = iter_background(
+        ((file_path, extension, read(file_path, extension)) for file_path, extension in files),
+        READ_AHEAD_FILES,
+    )
+    # Counts of content already encoded, by digest
+    if known is None:
+        known = {}
+    # A large file can only repeat earlier content when an earlier one had the same size
+    if streamed_sizes is None:
+        streamed_sizes = set()
+    # Finished results, or (path, extension, digest, batch index) waiting on the batch
+    pending = []
+    batch = []
+    batch_index: Dict[bytes, int] = {}
+    batch_chars = 0
+    for file_path, extension, item in reads:
+        if isinstance(item, io.IOBase):
+            try:
+                size = os.fstat(item.fileno()).st_size
+                with item, (_profiler.phase('stream', size) if _profiler is not None else nullcontext()):
+                    started = time.perf_counter()
+                    item = count_large_file(item, file_path, extension, cache, known if size in streamed_sizes else None)
+                    streamed_sizes.add(size)
+                    if _profiler is not None:
+                        _profiler.add_file(file_path, time.perf_counter() - started)
+            except Exception as e:
+                item = FileResult(file_path, extension, None, str(e))
+            if item.tokens is not None:
+                known[item.digest] = item.tokens
+        elif not isinstance(item, FileResult):
+            tokens = known.get(item[1])
+            if tokens is None and cache is not None:
+                tokens = cache.lookup(item[1])
+            if tokens is not None:
+                item = FileResult(file_path, extension, tokens, digest=item[1])
+        if isinstance(item, FileResult):
+            pending.append(item)
+        else:
+            content, digest = item
+            # A copy of content already waiting in this batch shares its slot
+            index = batch_index.get(digest)
+            if index is None:
+                index = batch_index[digest] = len(batch)
+                batch.append(content)
+                batch_chars += len(content)
+            pending.append((file_path, extension, digest, index))
+        if len(pending) >= BATCH_MAX_FILES or batch_chars >= BATCH_MAX_CHARS:
+            yield from _flush_batch(pending, batch, known)
+            pending = []
+            batch = []
+            batch_index = {}
+            batch_chars = 0
+    yield from _flush_batch(pending, batch, known)
+
+def count_file(file_path: str, extension: str, cache: Optional[TokenCache] = None) -> FileResult:
+    """Count tokens in a single file, returning an error message instead of raising."""
+    return next(iter_count_files([(file_path, extension)], cache))
+
+def _init_worker(tokenizer_specs: List[Tuple[str, str]], offline: bool = False, cache_dir: Optional[Path] = None, tokenizer_ids: Optional[List[str]] = None, profile: bool = False) -> None:
+    """Prepare a worker process, loading its tokenizers once up front."""
+    global _worker_cache, _profiler
+    # Workers already run in parallel, so keep the Rust tokenizer single-threaded
+    os.environ['TOKENIZERS_PARALLELISM'] = 'false'
+    os.environ['TRANSFORMERS_VERBOSITY'] = 'error'
+    warnings.filterwarnings('ignore')
+    configure_tokenizers(tokenizer_specs, offline)
+    if profile:
+        _profiler = Profiler()
+        with _profiler.phase('load'):
+            get_tokenizers()
+    else:
+        get_tokenizers()
+    if cache_dir is not None:
+        try:
+            _worker_cache = TokenCache(cache_dir, tokenizer_ids, read_only=True)
+        except sqlite3.Error:
+            _worker_cache = None
+
+def _worker_initargs(cache: Optional[TokenCache] = None) -> tuple:
+    """Arguments for _init_worker that recreate this process's tokenizers, cache and profiling."""
+    if cache is None:
+        return (_tokenizer_specs, _tokenizer_offline, None, None, _profiler is not None)
+    return (_tokenizer_specs, _tokenizer_offline, cache.path.parent, cache.tokenizer_ids, _profiler is not None)
+
+def _count_chunk(chunk: List[Tuple[str, str]]) -> List[FileResult]:
+    """Count tokens for a chunk of files inside a worker process."""
+    if len(_worker_known) > WORKER_KNOWN_MAX_ENTRIES:
+        _worker_known.clear()
+        _worker_streamed_sizes.clear()
+    return list(iter_count_files(chunk, _worker_cache, _worker_known, _worker_streamed_sizes))
+
+def _count_chunk_profiled(chunk: List[Tuple[str, str]]) -> list:
+    """Count a chunk like _count_chunk, also returning and resetting the worker's profile."""
+    results = _count_chunk(chunk)
+    global _profiler
+    profile, _profiler = _profiler, Profiler()
+    return [(results, profile.snapshot())]
+
+def iter_pool_counts(pool: ProcessPoolExecutor, files: Iterable[Tuple[str, str]], max_in_flight: int) -> Iterator[FileResult]:
+    """Count files in chunks on a worker pool, merging worker profiles into this one's."""
+    # Hand out files in chunks so each worker amortizes IPC over many small files
+    chunks = iter_chunks(files, 64)
+    if _profiler is None:
+        yield from iter_pool_map(pool, _count_chunk, chunks, max_in_flight)
+        return
+    for results, snapshot in iter_pool_map(pool, _count_chunk_profiled, chunks, max_in_flight):
+        _profiler.merge(snapshot)
+        yield from results
+
+def resolve_jobs(jobs: int) -> int:
+    """Resolve the requested worker count, where 0 means one worker per CPU."""
+    if jobs <= 0:
+        return os.cpu_count() or 1
+    return jobs
+
+def make_pool(jobs: int, cache: Optional[TokenCache] = None) -> ProcessPoolExecutor:
+    """Start a worker pool with this process's tokenizers and cache."""
+    import multiprocessing
+
+    # Pipeline threads may be running, which makes a plain fork() unsafe
+    context = multiprocessing.get_context('forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else None)
+    return ProcessPoolExecutor(max_workers=jobs, mp_context=context, initializer=_init_worker, initargs=_worker_initargs(cache))
+
+def iter_chunks(items: Iterable, size: int) -> Iterator[list]:
+    """Group a stream of items into lists of at most size items."""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def iter_pool_map(pool: ProcessPoolExecutor, fn, chunks: Iterable[list], max_in_flight: int) -> Iterator:
+    """Apply fn to each chunk in the pool, yielding results in order with bounded chunks in flight."""
+    in_flight = deque()
+    try:
+        for chunk in chunks:
+            in_flight.append(pool.submit(fn, chunk))
+            if len(in_flight) >= max_in_flight:
+                yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
+    finally:
+        # A consumer that stops early should not wait for chunks it will never read
+        for future in in_flight:
+            future.cancel()
+
+def iter_file_counts(files: Iterable[Tuple[str, str]], jobs: int = 1, cache: Optional[TokenCache] = None, window: int = 8, pool: Optional[ProcessPoolExecutor] = None) -> Iterator[FileResult]:
+    """Yield per-file token counts in the order of files, using a worker pool when jobs > 1.
+
+    Files are consumed as they arrive, so counting starts before discovery
+    finishes; at most window chunks per worker are in flight at once. An
+    existing pool of jobs workers (see make_pool) is shared instead of
+    starting a new one.
+    """
+    if pool is not None:
+        yield from iter_pool_counts(pool, files, max(jobs, 1) * window)
+        return
+    if jobs <= 1:
+        yield from iter_count_files(files, cache)
+        return
+
+    with make_pool(jobs, cache) as pool:
+        yield from iter_pool_counts(pool, files, jobs * window)
+
+def iter_cached_file_counts(all_files: Iterable[Tuple[str, str]], cache: Optional[TokenCache] = None, blob_ids: Optional[Dict[str, bytes]] = None, jobs: int = 1, pool: Optional[ProcessPoolExecutor] = None) -> Iterator[FileResult]:
+    """Yield per-file token counts in order, tokenizing only content not already known.
+
+    Files with a blob ID are tokenized once per unique blob and looked up in the
+    cache by that ID; other files go through the cache's stat and content-hash
+    lookups. Files are looked up as they stream in and only misses are passed
+    on for counting; answered files wait in line behind earlier misses.
+    """
+    blob_ids = blob_ids or {}
+    # Per blob: tokens, error, binary flag and content digest
+    blobs: Dict[bytes, Tuple[Optional[Counts], Optional[str], bool, Optional[bytes]]] = {}
+    queued_blobs = set()
+    # (path, extension, blob ID, stat, cached (digest, tokens), needs counting) per file, in input order
+    order = deque()
+
+    def misses() -> Iterator[Tuple[str, str]]:
+        for file_path, extension in all_files:
+            blob_id = blob_ids.get(file_path)
+            st = cached = None
+            if blob_id is not None:
+                # Duplicates of a known or queued blob are answered from its first copy
+                needs_count = blob_id not in blobs and blob_id not in queued_blobs
+                if needs_count:
+                    cached_blob = cache.lookup_blob(blob_id) if cache is not None else None
+                    if cached_blob is not None:
+                        # Keyed by content digest like files that are read, so copies cluster the same either way
+                        digest, tokens = cached_blob
+                        blobs[blob_id] = (tokens, None, False, digest)
+                        needs_count = False
+                    else:
+                        queued_blobs.add(blob_id)
+            elif cache is not None:
+                try:
+                    st = os.stat(file_path)
+                    cached = cache.lookup_file(os.path.abspath(file_path), st)
+                except OSError:
+                    pass
+                needs_count = cached is None
+            else:
+                needs_count = True
+            order.append((file_path, extension, blob_id, st, cached, needs_count))
+            if needs_count:
+                yield file_path, extension
+
+    def answered() -> Iterator[FileResult]:
+        while order and not order[0][5]:
+            file_path, extension, blob_id, _, cached, _ = order.popleft()
+            if blob_id is not None:
+                tokens, error, binary, digest = blobs[blob_id]
+                yield FileResult(file_path, extension, tokens, error, digest, binary)
+            else:
+                digest, tokens = cached
+                yield FileResult(file_path, extension, tokens, digest=digest)
+
+    for result in iter_file_counts(misses(), jobs, cache, pool=pool):
+        yield from answered()
+        file_path, _, blob_id, st, _, _ = order.popleft()
+        if blob_id is not None:
+            blobs[blob_id] = (result.tokens, result.error, result.binary, result.digest)
+            if cache is not None and result.tokens is not None:
+                cache.store(blob_id, result.tokens)
+                if result.digest is not None:
+                    cache.record_blob(blob_id, result.digest)
+        if cache is not None and result.digest is not None and result.tokens is not None:
+            cache.store(result.digest, result.tokens)
+            if st is not None:
+                cache.record_file(os.path.abspath(file_path), st, result.digest)
+        yield result
+    yield from answered()
+
+def _count_contents(chunk: List[str]) -> List[Counts]:
+    """Count tokens for a chunk of in-memory contents inside a worker process."""
+    return count_tokens_batch(chunk)
+
+def iter_content_counts(contents: Iterable[str], jobs: int = 1, window: int = 8) -> Iterator[Counts]:
+    """Yield token counts for a stream of contents in order, keeping at most window chunks in flight."""
+    if jobs <= 1:
+        for batch in iter_batches(contents):
+            yield from count_tokens_batch(batch)
+        return
+
+    with make_pool(jobs) as pool:
+        yield from iter_pool_map(pool, _count_contents, iter_chunks(contents, 64), jobs * window)
+
+def list_tree_blobs(repo: 'Repo', ref: str) -> List[Tuple[str, str, str]]:
+    """List (path, extension, blob ID) for tokenizable blobs in the tree at ref."""
+    blobs = []
+    for entry in repo.git.ls_tree('-r', '-z', '--full-tree', ref).split('\0'):
+        if not entry:
+            continue
+        meta, relative_path = entry.split('\t', 1)
+        mode, object_type, blob_id = meta.split(' ')
+        if object_type != 'blob' or not mode.startswith('100'):
+            continue
+        extension = os.path.splitext(relative_path)[1].lower()
+        if extension in FILE_EXTENSIONS:
+            blobs.append((relative_path, extension, blob_id))
+    return blobs
+
+def clone_for_objects(url: str, dest: str) -> 'Repo':
+    """Make a bare, blobless clone: commits and trees only, blobs are fetched on demand."""
+    from git import Repo
+
+    return Repo.clone_from(url, dest, bare=True, filter='blob:none')
+
+def prefetch_blobs(repo: 'Repo', blob_ids: Iterable[str]) -> None:
+    """Fetch missing blobs of a partial clone in a single batched request."""
+    # Same invocation git uses internally to backfill a promisor remote
+    subprocess.run(
+        ['git', '-c', 'fetch.negotiationAlgorithm=noop', 'fetch', 'origin', '--no-tags',
+         '--no-write-fetch-head', '--recurse-submodules=no', '--filter=blob:none', '--stdin'],
+        cwd=repo.git_dir,
+        input='\n'.join(blob_ids) + '\n',
+        text=True,
+        capture_output=True,
+        check=True,
+    )
+
+def process_git_tree(repo: 'Repo', ref: str = 'HEAD', total_only: bool = False, jobs: int = 1, cache: Optional[TokenCache] = None, partial: bool = False) -> Tuple[Counts, Dict[str, Counts], Dict[str, int]]:
+    """Count tokens for the tree at ref by streaming blobs from the object store, without a checkout."""
+    total_tokens = zero_counts()
     extension_stats = {}
     file_counts = {}
 
-    # Load .gitignore patterns
-    spec = load_gitignore(Path(repo_path))
+    commit = repo.commit(ref)
+    blobs = list_tree_blobs(repo, commit.hexsha)
 
-    # Get list of all files
-    all_files = []
-    for root, dirs, files in os.walk(repo_path):
-        for file in files:
-            file_path = os.path.join(root, file)
-            extension = os.path.splitext(file)[1].lower()
-            if extension in FILE_EXTENSIONS and not is_binary(file_path):
-                if should_ignore(Path(file_path), spec, Path(repo_path)):
-                    continue
-                all_files.append((file_path, extension))
-                file_counts[extension] = file_counts.get(extension, 0) + 1
+    # Each unique blob is tokenized once; cached blobs are never read at all
+    known: Dict[str, Counts] = {}
+    if cache is not None:
+        for _, _, blob_id in blobs:
+            if blob_id not in known:
+                tokens = cache.lookup(bytes.fromhex(blob_id))
+                if tokens is not None:
+                    known[blob_id] = tokens
+    missing = list(dict.fromkeys(blob_id for _, _, blob_id in blobs if blob_id not in known))
+    if partial and missing:
+        if not total_only:
+            console.print(f"[yellow]Fetching {len(missing)} blobs[/yellow]")
+        prefetch_blobs(repo, missing)
+
+    binary = set()
+    read_order = deque()
+
+    def read_blobs() -> Iterator[str]:
+        # GitPython keeps one persistent 'git cat-file --batch' process per repo
+        for blob_id in (track(missing, description="[bold blue]Processing blobs") if not total_only else missing):
+            _, _, _, data = repo.git.get_object_data(blob_id)
+            if is_binary_bytes(data):
+                binary.add(blob_id)
+                continue
+            read_order.append(blob_id)
+            yield decode_text(data)
+
+    for tokens in iter_content_counts(read_blobs(), jobs):
+        blob_id = read_order.popleft()
+        known[blob_id] = tokens
+        if cache is not None:
+            cache.store(bytes.fromhex(blob_id), tokens)
+
+    for relative_path, extension, blob_id in blobs:
+        if blob_id in binary:
+            continue
+        file_counts[extension] = file_counts.get(extension, 0) + 1
+        tokens = known[blob_id]
+        total_tokens = add_counts(total_tokens, tokens)
+        extension_stats[extension] = add_counts(extension_stats.get(extension, zero_counts()), tokens)
+
+    return total_tokens, extension_stats, file_counts
+
+class HistoryPoint(NamedTuple):
+    """Token totals for one commit of a history walk."""
+    commit: str
+    timestamp: int
+    total_tokens: Counts
+    extension_stats: Dict[str, Counts]
+    file_counts: Dict[str, int]
+
+def iter_history_changes(repo: 'Repo', revision_range: str) -> Iterator[Tuple[str, int, List[Tuple[str, str, str]]]]:
+    """Yield (commit, timestamp, changes) along the first-parent chain, oldest first.
+
+    Each change is (path, new mode, new blob ID); deletions have an all-zero mode.
+    """
+    output = repo.git.log(
+        '--reverse', '--first-parent', '--diff-merges=first-parent', '--raw', '-z',
+        '--no-renames', '--no-abbrev', '--format=%H %ct', revision_range,
+    )
+    commit = None
+    timestamp = 0
+    changes = []
+    fields = iter(output.split('\0'))
+    for field in fields:
+        field = field.lstrip('\n')
+        if not field:
+            continue
+        if field.startswith(':'):
+            _, new_mode, _, new_blob, _ = field[1:].split(' ')
+            changes.append((next(fields), new_mode, new_blob))
+            continue
+        if commit is not None:
+            yield commit, timestamp, changes
+        commit, timestamp = field.split(' ')
+        timestamp = int(timestamp)
+        changes = []
+    if commit is not None:
+        yield commit, timestamp, changes
+
+def process_history(repo: 'Repo', revision_range: str, total_only: bool = False, jobs: int = 1, cache: Optional[TokenCache] = None, partial: bool = False) -> List[HistoryPoint]:
+    """Count tokens for every commit in a range, tokenizing each blob only once."""
+    history = list(iter_history_changes(repo, revision_range))
+    if not history:
+        return []
+
+    # Seed the walk with the tree the range starts from
+    tree: Dict[str, Tuple[str, str]] = {}
+    first = repo.commit(history[0][0])
+    if first.parents:
+        for relative_path, extension, blob_id in list_tree_blobs(repo, first.parents[0].hexsha):
+            tree[relative_path] = (extension, blob_id)
+
+    # Gather every blob that ever appears so each is read and tokenized once
+    needed = dict.fromkeys(blob_id for _, blob_id in tree.values())
+    for _, _, changes in history:
+        for relative_path, mode, blob_id in changes:
+            if mode.startswith('100') and os.path.splitext(relative_path)[1].lower() in FILE_EXTENSIONS:
+                needed[blob_id] = None
+
+    # Blob ID -> tokens for every text blob (non-UTF-8 text is decoded as latin-1); binary blobs stay absent
+    known: Dict[str, Counts] = {}
+    if cache is not None:
+        for blob_id in needed:
+            tokens = cache.lookup(bytes.fromhex(blob_id))
+            if tokens is not None:
+                known[blob_id] = tokens
+    missing = [blob_id for blob_id in needed if blob_id not in known]
+    if partial and missing:
+        if not total_only:
+            console.print(f"[yellow]Fetching {len(missing)} blobs[/yellow]")
+        prefetch_blobs(repo, missing)
+
+    read_order = deque()
+
+    def read_blobs() -> Iterator[str]:
+        for blob_id in (track(missing, description="[bold blue]Processing blobs") if not total_only else missing):
+            _, _, _, data = repo.git.get_object_data(blob_id)
+            if is_binary_bytes(data):
+                continue
+            read_order.append(blob_id)
+            yield decode_text(data)
+
+    for tokens in iter_content_counts(read_blobs(), jobs):
+        blob_id = read_order.popleft()
+        known[blob_id] = tokens
+        if cache is not None:
+            cache.store(bytes.fromhex(blob_id), tokens)
+
+    # Replay the changes, adjusting running totals by each blob's contribution
+    total_tokens = zero_counts()
+    extension_stats: Dict[str, Counts] = {}
+    file_counts: Dict[str, int] = {}
+
+    def apply(extension: str, blob_id: str, sign: int) -> None:
+        nonlocal total_tokens
+        if blob_id not in known:
+            return
+        tokens = known[blob_id]
+        total_tokens = add_counts(total_tokens, tokens, sign)
+        extension_stats[extension] = add_counts(extension_stats.get(extension, zero_counts()), tokens, sign)
+        file_counts[extension] = file_counts.get(extension, 0) + sign
+
+    for extension, blob_id in tree.values():
+        apply(extension, blob_id, 1)
+
+    points = []
+    for commit, timestamp, changes in history:
+        for relative_path, mode, blob_id in changes:
+            previous = tree.pop(relative_path, None)
+            if previous is not None:
+                apply(previous[0], previous[1], -1)
+            extension = os.path.splitext(relative_path)[1].lower()
+            if mode.startswith('100') and extension in FILE_EXTENSIONS:
+                tree[relative_path] = (extension, blob_id)
+                apply(extension, blob_id, 1)
+        points.append(HistoryPoint(
+            commit,
+            timestamp,
+            total_tokens,
+            {ext: count for ext, count in extension_stats.items() if file_counts.get(ext)},
+            {ext: count for ext, count in file_counts.items() if count},
+        ))
+
+    return points
+
+def technology_stats(extension_stats: Dict[str, Counts], file_counts: Dict[str, int]) -> Tuple[Dict[str, Counts], Dict[str, int]]:
+    """Group per-extension token and file counts by technology."""
+    tech_stats = {}
+    tech_file_counts = {}
+    for ext, count in extension_stats.items():
+        tech = FILE_EXTENSIONS[ext]
+        tech_stats[tech] = add_counts(tech_stats.get(tech, zero_counts()), count)
+        tech_file_counts[tech] = tech_file_counts.get(tech, 0) + file_counts[ext]
+    return tech_stats, tech_file_counts
+
+def write_history(points: List[HistoryPoint], output, output_format: str) -> None:
+    """Write a per-commit token series as JSON or long-format CSV.
+
+    JSON token fields use the first tokenizer; with several tokenizers each
+    entry also carries a byTokenizer breakdown. CSV has one row per tokenizer.
+    """
+    labels = tokenizer_labels()
+
+    if output_format == 'csv':
+        writer = csv.writer(output)
+        writer.writerow(['commit', 'timestamp', 'tokenizer', 'group', 'key', 'tokens', 'files'])
+        for point in points:
+            tech_stats, tech_file_counts = technology_stats(point.extension_stats, point.file_counts)
+            for i, label in enumerate(labels):
+                writer.writerow([point.commit, point.timestamp, label, 'total', '', point.total_tokens[i], sum(point.file_counts.values())])
+                for ext, count in sorted(point.extension_stats.items()):
+                    writer.writerow([point.commit, point.timestamp, label, 'extension', ext, count[i], point.file_counts[ext]])
+                for tech, count in sorted(tech_stats.items()):
+                    writer.writerow([point.commit, point.timestamp, label, 'technology', tech, count[i], tech_file_counts[tech]])
+        return
+
+    series = [
+        {'commit': point.commit, 'timestamp': point.timestamp, **summary_json(point.total_tokens, point.extension_stats, point.file_counts)}
+        for point in points
+    ]
+    json.dump(series, output, indent=2)
+    output.write('\n')
+
+def summary_json(total_tokens: Counts, extension_stats: Dict[str, Counts], file_counts: Dict[str, int]) -> Dict[str, object]:
+    """Totals and per-extension and per-technology breakdowns as a JSON-ready dict.
+
+    Token fields use the first tokenizer; with several tokenizers each entry
+    also carries a byTokenizer breakdown.
+    """
+    labels = tokenizer_labels()
+
+    def entry(tokens: Counts, files: int) -> Dict[str, object]:
+        data = {'tokens': tokens[0], 'files': files}
+        if len(labels) > 1:
+            data['byTokenizer'] = dict(zip(labels, tokens))
+        return data
+
+    tech_stats, tech_file_counts = technology_stats(extension_stats, file_counts)
+    item = {
+        'totalTokens': total_tokens[0],
+        'files': sum(file_counts.values()),
+        'extensions': {
+            ext: entry(count, file_counts[ext])
+            for ext, count in sorted(extension_stats.items())
+        },
+        'technologies': {
+            tech: entry(count, tech_file_counts[tech])
+            for tech, count in sorted(tech_stats.items())
+        },
+    }
+    if len(labels) > 1:
+        item['totalTokensByTokenizer'] = dict(zip(labels, total_tokens))
+    return item
+
+def list_candidate_files(repo_path: str, total_only: bool = False, git_index: bool = False) -> Tuple[Iterable[Tuple[str, str]], Optional[Dict[str, bytes]]]:
+    """Return the files to count and, from the git index, their blob IDs."""
+    blob_ids = None
+    if git_index:
+        from git.exc import GitCommandError, InvalidGitRepositoryError, NoSuchPathError
 
-    # Process files
-    for file_path, extension in (track(all_files, description="[bold blue]Processing files") if not total_only else all_files):
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-                tokens = count_tokens(content)
-                total_tokens += tokens
-                if extension not in extension_stats:
-                    extension_stats[extension] = tokens
-                else:
-                    extension_stats[extension] += tokens
-        except Exception as e:
+            with _profiler.phase('walk') if _profiler is not None else nullcontext():
+                all_files, blob_ids = collect_git_files(repo_path)
+        except (GitCommandError, InvalidGitRepositoryError, NoSuchPathError):
             if not total_only:
-                console.print(f"[red]Error processing {file_path}: {str(e)}[/red]")
+                console.print(f"[yellow]{repo_path} is not a git work tree, walking the filesystem instead[/yellow]")
+            git_index = False
+    if not git_index:
+        # Walk in a background thread, feeding files to the readers as they are found
+        all_files = iter_background(iter_files(repo_path))
+    return all_files, blob_ids
+
+def iter_repository_counts(all_files: Iterable[Tuple[str, str]], blob_ids: Optional[Dict[str, bytes]] = None, total_only: bool = False, jobs: int = 1, cache: Optional[TokenCache] = None, pool: Optional[ProcessPoolExecutor] = None) -> Iterator[FileResult]:
+    """Count files through the cache-aware or plain pipeline, with progress unless total_only."""
+    if cache is not None or blob_ids:
+        results = iter_cached_file_counts(all_files, cache, blob_ids, resolve_jobs(jobs), pool)
+    else:
+        results = iter_file_counts(all_files, resolve_jobs(jobs), pool=pool)
+    if not total_only:
+        results = track(results, description="[bold blue]Processing files")
+    return results
+
+class DuplicateTracker:
+    """Groups counted files by content digest to report duplicated content."""
+
+    def __init__(self):
+        # digest -> (tokens of one copy, relative paths of every copy)
+        self.clusters: Dict[bytes, Tuple[Counts, List[str]]] = {}
+
+    def add(self, digest: bytes, relative_path: str, tokens: Counts) -> None:
+        """Record one counted file."""
+        cluster = self.clusters.get(digest)
+        if cluster is None:
+            self.clusters[digest] = (tokens, [relative_path])
+        else:
+            cluster[1].append(relative_path)
+
+    def unique_tokens(self) -> Counts:
+        """Total tokens with every distinct content counted once."""
+        total = zero_counts()
+        for tokens, _ in self.clusters.values():
+            total = add_counts(total, tokens)
+        return total
+
+    def duplicate_files(self) -> int:
+        """Number of files that repeat content found elsewhere."""
+        return sum(len(paths) - 1 for _, paths in self.clusters.values())
+
+    def largest(self, limit: int = 10) -> List[Tuple[Counts, List[str]]]:
+        """Clusters of identical files, most tokens spent on extra copies first."""
+        clusters = [cluster for cluster in self.clusters.values() if len(cluster[1]) > 1]
+        clusters.sort(key=lambda cluster: cluster[0][0] * (len(cluster[1]) - 1), reverse=True)
+        return clusters[:limit]
+
+def process_repository(repo_path: str, total_only: bool = False, jobs: int = 1, cache: Optional[TokenCache] = None, git_index: bool = False, pool: Optional[ProcessPoolExecutor] = None, duplicates: Optional[DuplicateTracker] = None) -> Tuple[Counts, Dict[str, Counts], Dict[str, int]]:
+    """Process all files in the repository and count tokens with every configured tokenizer.
+
+    Counted files are also recorded in duplicates, when given.
+    """
+    total_tokens = zero_counts()
+    extension_stats = {}
+
+    all_files, blob_ids = list_candidate_files(repo_path, total_only, git_index)
+    results = iter_repository_counts(all_files, blob_ids, total_only, jobs, cache, pool)
+
+    # Process files
+    file_counts = {}
+    for result in results:
+        file_path, extension, tokens, error = result.path, result.extension, result.tokens, result.error
+        if result.binary:
+            continue
+        file_counts[extension] = file_counts.get(extension, 0) + 1
+        if error is not None:
+            if not total_only:
+                console.print(f"[red]Error processing {file_path}: {error}[/red]")
+            continue
+        total_tokens = add_counts(total_tokens, tokens)
+        if duplicates is not None and result.digest is not None:
+            duplicates.add(result.digest, os.path.relpath(file_path, repo_path), tokens)
+        if extension not in extension_stats:
+            extension_stats[extension] = tokens
+        else:
+            extension_stats[extension] = add_counts(extension_stats[extension], tokens)
 
     return total_tokens, extension_stats, file_counts
 
+def clone_repository(url: str, dest: str) -> None:
+    """Clone a repository into dest for counting."""
+    from git import Repo
+
+    Repo.clone_from(url, dest).close()
+
+class RepositoryResult(NamedTuple):
+    """Counts for one target of count_repositories; error is set, with empty counts, when it failed."""
+    target: str
+    total_tokens: Counts
+    extension_stats: Dict[str, Counts]
+    file_counts: Dict[str, int]
+    error: Optional[str] = None
+
+async def count_repositories(targets: Iterable[str], jobs: int = 0, max_clones: int = 4, max_concurrent: int = 8, cache: Optional[TokenCache] = None, git_index: bool = False) -> AsyncIterator[RepositoryResult]:
+    """Count many repository URLs or local directories concurrently, yielding each result as it finishes.
+
+    At most max_clones clones and max_concurrent counts run at once. With
+    jobs > 1 (0 = one per CPU) every count shares one worker pool, so each
+    worker loads the tokenizers once; otherwise counts share this process's
+    tokenizers. Call configure_tokenizers first to count with others than
+    the default, e.g.::
+
+        async for result in count_repositories(["https://github.com/o/r", "../other"]):
+            print(result.target, result.total_tokens[0])
+    """
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+    loop = asyncio.get_running_loop()
+    jobs = resolve_jobs(jobs)
+    clone_slots = asyncio.Semaphore(max_clones)
+    with ThreadPoolExecutor(max_workers=max_concurrent + max_clones) as threads, \
+            (make_pool(jobs, cache) if jobs > 1 else nullcontext()) as pool:
+        count_slots = asyncio.Semaphore(max_concurrent)
+        if pool is None:
+            await loop.run_in_executor(threads, get_tokenizers)
+
+        async def count(target: str) -> RepositoryResult:
+            temp_dir = None
+            try:
+                repo_path = target
+                if not os.path.isdir(target):
+                    temp_dir = tempfile.mkdtemp()
+                    async with clone_slots:
+                        await loop.run_in_executor(threads, clone_repository, target, temp_dir)
+                    repo_path = temp_dir
+                async with count_slots:
+                    counts = await loop.run_in_executor(
+                        threads, lambda: process_repository(repo_path, True, jobs, cache, git_index, pool)
+                    )
+                return RepositoryResult(target, *counts)
+            except Exception as e:
+                return RepositoryResult(target, zero_counts(), {}, {}, str(e))
+            finally:
+                if temp_dir:
+                    await loop.run_in_executor(threads, shutil.rmtree, temp_dir, True)
+
+        tasks = [asyncio.ensure_future(count(target)) for target in targets]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield await finished
+        finally:
+            for task in tasks:
+                task.cancel()
+
+# Quiet period after a change event before recounting, so a burst of writes becomes one update
+WATCH_SETTLE_SECONDS = 0.02
+
+class WatchState:
+    """Per-file token counts kept in memory for --watch, with aggregates updated incrementally."""
+
+    def __init__(self, repo_path: str):
+        self.repo_path = repo_path
+        self.matcher = GitignoreMatcher(repo_path)
+        # path -> (extension, tokens, size, mtime_ns) for every counted text file
+        self.files: Dict[str, Tuple[str, Counts, int, int]] = {}
+        self.total_tokens = zero_counts()
+        self.extension_stats: Dict[str, Counts] = {}
+        self.file_counts: Dict[str, int] = {}
+
+    def _apply(self, extension: str, tokens: Counts, sign: int) -> None:
+        self.total_tokens = add_counts(self.total_tokens, tokens, sign)
+        self.extension_stats[extension] = add_counts(self.extension_stats.get(extension, zero_counts()), tokens, sign)
+        self.file_counts[extension] = self.file_counts.get(extension, 0) + sign
+        if not self.file_counts[extension]:
+            del self.file_counts[extension]
+            del self.extension_stats[extension]
+
+    def rescan(self, total_only: bool = True, jobs: int = 1, cache: Optional[TokenCache] = None, start: str = '', directories: Optional[List[str]] = None) -> int:
+        """Walk the tree, or only the subtree at start, again, recounting files whose size or mtime changed.
+
+        Returns how many counted files were added, removed or changed. Every
+        directory walked is appended to directories if given.
+        """
+        if start:
+            prefix = os.path.join(self.repo_path, *start.split('/'), '')
+            previous = {path: entry for path, entry in self.files.items() if path.startswith(prefix)}
+        else:
+            previous = dict(self.files)
+        files = {}
+        stale = []
+        stats = {}
+        # A subtree that is now ignored or gone simply loses its files
+        walk = iter_files(self.repo_path, self.matcher, start, directories) if not (start and self.matcher.is_path_ignored(start, True)) else ()
+        for file_path, extension in walk:
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                continue
+            known = previous.get(file_path)
+            if known is not None and known[2:] == (st.st_size, st.st_mtime_ns):
+                files[file_path] = known
+            else:
+                stale.append((file_path, extension))
+                stats[file_path] = st
+        for result in iter_repository_counts(stale, None, total_only, jobs, cache):
+            if result.error is not None and not total_only:
+                console.print(f"[red]Error processing {result.path}: {result.error}[/red]")
+            if not result.binary:
+                st = stats[result.path]
+                files[result.path] = (result.extension, result.tokens or zero_counts(), st.st_size, st.st_mtime_ns)
+
+        changed = 0
+        for file_path, old in list(previous.items()):
+            if files.get(file_path) != old:
+                del self.files[file_path]
+                self._apply(old[0], old[1], -1)
+                changed += 1
+        for file_path, new in files.items():
+            if file_path not in self.files:
+                self.files[file_path] = new
+                self._apply(new[0], new[1], 1)
+                changed += file_path not in previous
+        return changed
+
+    def update(self, paths: Iterable[str], total_only: bool = True) -> int:
+        """Recount changed, created or deleted files, returning how many counted files changed."""
+        changed = 0
+        for file_path in paths:
+            extension = os.path.splitext(file_path)[1].lower()
+            if extension not in FILE_EXTENSIONS:
+                continue
+            relative_path = os.path.relpath(file_path, self.repo_path).replace(os.sep, '/')
+            old = self.files.pop(file_path, None)
+            if old is not None:
+                self._apply(old[0], old[1], -1)
+            new = None
+            try:
+                st = os.stat(file_path)
+                if stat.S_ISREG(st.st_mode) and not self.matcher.is_path_ignored(relative_path):
+                    if old is not None and old[2:] == (st.st_size, st.st_mtime_ns):
+                        new = old
+                    else:
+                        result = count_file(file_path, extension)
+                        if result.error is not None and not total_only:
+                            console.print(f"[red]Error processing {file_path}: {result.error}[/red]")
+                        if not result.binary:
+                            new = (extension, result.tokens or zero_counts(), st.st_size, st.st_mtime_ns)
+            except OSError:
+                pass
+            if new is not None:
+                self.files[file_path] = new
+                self._apply(extension, new[1], 1)
+            if new != old:
+                changed += 1
+        return changed
+
+def write_atomic(path: Path, data: bytes) -> None:
+    """Replace a file's content in one step, so readers never see a partial write."""
+    temp_path = path.with_name(path.name + '.tmp')
+    temp_path.write_bytes(data)
+    os.replace(temp_path, path)
+
+def _raise_interrupt(signum, frame) -> None:
+    raise KeyboardInterrupt
+
+def outermost_directories(relative_dirs: Iterable[str]) -> List[str]:
+    """Drop directories nested in another one of the set, so each subtree is walked once."""
+    outermost = []
+    for relative_dir in sorted(relative_dirs):
+        if not any(outer == '' or relative_dir.startswith(outer + '/') for outer in outermost):
+            outermost.append(relative_dir)
+    return outermost
+
+def watch_repository(repo_path: str, total_only: bool = False, jobs: int = 1, cache: Optional[TokenCache] = None, status_file: Optional[Path] = None, status_socket: Optional[Path] = None) -> None:
+    """Count the tree once, then keep the totals current as files change until interrupted.
+
+    Each update is printed and, if requested, written to status_file and
+    served as JSON to every connection on the Unix socket status_socket.
+    """
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+
+    repo_path = os.path.abspath(repo_path)
+    state = WatchState(repo_path)
+    walked: List[str] = []
+    state.rescan(total_only, jobs, cache, directories=walked)
+    snapshot = b''
+
+    def publish() -> None:
+        nonlocal snapshot
+        data = {'timestamp': round(time.time(), 3), **summary_json(state.total_tokens, state.extension_stats, state.file_counts)}
+        snapshot = (json.dumps(data) + '\n').encode('utf-8')
+        if status_file is not None:
+            write_atomic(status_file, snapshot)
+
+    def report(changed: int, started: float) -> None:
+        if total_only:
+            if len(state.total_tokens) == 1:
+                print(state.total_tokens[0], flush=True)
+            else:
+                print('\t'.join(f"{label}\t{count}" for label, count in zip(tokenizer_labels(), state.total_tokens)), flush=True)
+        else:
+            console.print(
+                f"[dim]{time.strftime('%H:%M:%S')}[/dim] {changed} file{'' if changed == 1 else 's'} changed, total tokens: "
+                f"[green]{format_number(state.total_tokens[0])}[/green] "
+                f"({(time.perf_counter() - started) * 1000:.0f} ms)"
+            )
+
+    class StatusHandler(socketserver.BaseRequestHandler):
+        def handle(self):
+            self.request.sendall(snapshot)
+
+    events = queue.Queue()
+
+    class ChangeHandler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            # Directory modifications only mirror the file events inside them
+            if event.event_type not in ('opened', 'closed_no_write') and not (event.is_directory and event.event_type == 'modified'):
+                events.put(event)
+
+    handler = ChangeHandler()
+    observer = Observer()
+    # Each directory the walk reaches gets its own non-recursive watch, so
+    # ignored trees such as build/ or node_modules/ are never watched at all
+    watches = {}
+
+    def sync_watches(start: str, directories: List[str]) -> None:
+        """Watch the directories just walked below start and drop watches on the ones no longer reached."""
+        root = os.path.join(repo_path, *start.split('/')) if start else repo_path
+        prefix = os.path.join(root, '')
+        reached = set(directories)
+        for directory in [d for d in watches if (d == root or d.startswith(prefix)) and d not in reached]:
+            try:
+                observer.unschedule(watches.pop(directory))
+            except (KeyError, OSError):
+                pass
+        for directory in directories:
+            if directory not in watches:
+                try:
+                    watches[directory] = observer.schedule(handler, directory, recursive=False)
+                except OSError:
+                    # Removed again before the watch was added; its own event triggers another rescan
+                    pass
+
+    sync_watches('', walked)
+    exclude_dir = os.path.join(repo_path, '.git', 'info')
+    if os.path.isdir(exclude_dir):
+        observer.schedule(handler, exclude_dir, recursive=False)
+
+    # Stop as cleanly on a service manager's SIGTERM as on Ctrl-C
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+    server = None
+    observer.start()
+    try:
+        publish()
+        if status_socket is not None:
+            # A socket left behind by an earlier run would make bind() fail
+            if status_socket.exists() and stat.S_ISSOCK(status_socket.stat().st_mode):
+                status_socket.unlink()
+            server = socketserver.ThreadingUnixStreamServer(str(status_socket), StatusHandler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        if total_only:
+            report(0, time.perf_counter())
+        else:
+            print_results(state.total_tokens, state.extension_stats, state.file_counts)
+            console.print(f"\n[green]Watching {repo_path} for changes (Ctrl-C to stop)[/green]")
+
+        while True:
+            batch = [events.get()]
+            started = time.perf_counter()
+            while True:
+                try:
+                    batch.append(events.get(timeout=WATCH_SETTLE_SECONDS))
+                except queue.Empty:
+                    break
+
+            paths = set()
+            subtrees = set()
+            for event in batch:
+                for path in (event.src_path, getattr(event, 'dest_path', '')):
+                    if not path:
+                        continue
+                    path = os.fsdecode(path)
+                    relative_path = os.path.relpath(path, repo_path).replace(os.sep, '/')
+                    if '.git' in relative_path.split('/'):
+                        if relative_path == '.git/info/exclude':
+                            subtrees.add('')
+                    elif os.path.basename(path) == '.gitignore':
+                        # Rule changes affect the directory holding the .gitignore
+                        subtrees.add(os.path.dirname(relative_path))
+                    elif event.is_directory:
+                        # New, moved or deleted directories affect their whole subtree, unless it is ignored
+                        if not state.matcher.is_path_ignored(relative_path, True):
+                            subtrees.add(relative_path)
+                    else:
+                        paths.add(path)
+
+            changed = 0
+            for start in outermost_directories(subtrees):
+                directories = []
+                changed += state.rescan(True, jobs, cache, start, directories)
+                sync_watches(start, directories)
+            changed += state.update(paths, total_only)
+            if not changed:
+                continue
+            publish()
+            report(changed, started)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        observer.stop()
+        observer.join()
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+            status_socket.unlink(missing_ok=True)
+
+# Exit status when --budget is exceeded, distinct from errors (1) and usage errors (2)
+EXIT_OVER_BUDGET = 3
+
+class BudgetResult(NamedTuple):
+    """Outcome of a --budget run.
+
+    total_tokens includes the file that ran over the budget, if any; fitted
+    lists the relative paths and counts of the files counted before it, and
+    fitted_entries the top-level files and directories that fit entirely.
+    """
+    total_tokens: Counts
+    exceeded: bool
+    files_counted: int
+    files_total: int
+    fitted: List[Tuple[str, Counts]]
+    fitted_entries: Dict[str, Tuple[Counts, int]]
+
+def order_by_size(files: Iterable[Tuple[str, str]], order: str) -> List[Tuple[str, str]]:
+    """Sort files 'largest' or 'smallest' first; files that cannot be stat()ed sort as empty."""
+    def size(item: Tuple[str, str]) -> int:
+        try:
+            return os.stat(item[0]).st_size
+        except OSError:
+            return 0
+    return sorted(files, key=size, reverse=order == 'largest')
+
+def process_budget(repo_path: str, budget: int, order: str = 'walk', total_only: bool = False, jobs: int = 1, cache: Optional[TokenCache] = None, git_index: bool = False) -> BudgetResult:
+    """Count files in the given order until the first tokenizer's running total exceeds budget."""
+    all_files, blob_ids = list_candidate_files(repo_path, total_only, git_index)
+    all_files = order_by_size(all_files, order) if order != 'walk' else list(all_files)
+
+    def entry_of(file_path: str) -> str:
+        relative_path = os.path.relpath(file_path, repo_path)
+        head, sep, _ = relative_path.partition(os.sep)
+        return head + '/' if sep else head
+
+    remaining: Dict[str, int] = {}
+    for file_path, _ in all_files:
+        entry = entry_of(file_path)
+        remaining[entry] = remaining.get(entry, 0) + 1
+
+    total_tokens = zero_counts()
+    exceeded = False
+    files_counted = 0
+    fitted = []
+    entry_stats: Dict[str, Counts] = {}
+    entry_files: Dict[str, int] = {}
+    results = iter_repository_counts(all_files, blob_ids, total_only, jobs, cache)
+    try:
+        for result in results:
+            files_counted += 1
+            if result.error is not None and not total_only:
+                console.print(f"[red]Error processing {result.path}: {result.error}[/red]")
+            if result.tokens is not None:
+                total_tokens = add_counts(total_tokens, result.tokens)
+                if total_tokens[0] > budget:
+                    exceeded = True
+                    break
+                fitted.append((os.path.relpath(result.path, repo_path), result.tokens))
+            entry = entry_of(result.path)
+            remaining[entry] -= 1
+            if not result.binary:
+                entry_stats[entry] = add_counts(entry_stats.get(entry, zero_counts()), result.tokens or zero_counts())
+                entry_files[entry] = entry_files.get(entry, 0) + 1
+    finally:
+        # Stops the reader and worker pipeline without counting the rest
+        results.close()
+
+    fitted_entries = {
+        entry: (tokens, entry_files[entry]) for entry, tokens in entry_stats.items() if remaining[entry] == 0
+    }
+    return BudgetResult(total_tokens, exceeded, files_counted, len(all_files), fitted, fitted_entries)
+
+def print_budget(result: BudgetResult, budget: int) -> None:
+    """Print whether the budget held and the top-level files and directories that fit in it."""
+    from rich.table import Table
+
+    if result.exceeded:
+        console.print(
+            f"\n[bold red]Over budget: more than {budget:,} tokens after {result.files_counted} "
+            f"of {result.files_total} files[/bold red]"
+        )
+    else:
+        console.print(f"\n[bold green]Within budget: {result.total_tokens[0]:,} of {budget:,} tokens[/bold green]")
+
+    used = sum(tokens[0] for _, tokens in result.fitted)
+    console.print(f"{len(result.fitted)} files fit, using [green]{format_number(used)}[/green] tokens")
+
+    table = Table(title="\n[bold]Fits in the budget[/bold]")
+    table.add_column("Path", style="cyan")
+    table.add_column("Tokens", justify="right", style="green")
+    table.add_column("Files", justify="right", style="yellow")
+    for entry, (tokens, files) in sorted(result.fitted_entries.items(), key=lambda x: x[1][0][0], reverse=True):
+        table.add_row(entry, format_number(tokens[0]), f"{files}")
+    console.print(table)
+
+# Files tokenized by --estimate, spread over extensions in proportion to their bytes
+ESTIMATE_SAMPLE_FILES = 1000
+# Smallest sample per extension, so every extension gets a variance estimate
+ESTIMATE_MIN_PER_EXTENSION = 5
+# Two-sided 95% quantile of the normal distribution
+ESTIMATE_Z = 1.96
+
+class Estimate(NamedTuple):
+    """Token counts extrapolated from a sample, with 95% confidence margins per tokenizer."""
+    total_tokens: Counts
+    total_margin: Counts
+    extension_stats: Dict[str, Counts]
+    extension_margins: Dict[str, Counts]
+    file_counts: Dict[str, int]
+    sampled: Dict[str, int]
+
+def ratio_estimate(population_files: int, population_bytes: int, sample: List[Tuple[int, int]]) -> Tuple[float, float]:
+    """Extrapolate a stratum total from (bytes, tokens) samples by tokens per byte.
+
+    Returns the estimate and its variance, from the usual ratio estimator
+    with a finite population correction; a fully sampled stratum is exact.
+    """
+    n = len(sample)
+    sample_bytes = sum(size for size, _ in sample)
+    ratio = sum(tokens for _, tokens in sample) / sample_bytes if sample_bytes else 0.0
+    estimate = ratio * population_bytes
+    if n >= population_files or n < 2:
+        return estimate, 0.0
+    residual_variance = sum((tokens - ratio * size) ** 2 for size, tokens in sample) / (n - 1)
+    return estimate, population_files ** 2 * (1 - n / population_files) * residual_variance / n
+
+def estimate_repository(repo_path: str, total_only: bool = False, jobs: int = 1, cache: Optional[TokenCache] = None, sample_files: int = ESTIMATE_SAMPLE_FILES, seed: Optional[int] = None) -> Estimate:
+    """Estimate token counts from file sizes and a stratified random sample per extension."""
+    strata: Dict[str, List[Tuple[str, int]]] = {}
+    for file_path, extension in iter_files(repo_path):
+        try:
+            size = os.stat(file_path).st_size
+        except OSError:
+            continue
+        strata.setdefault(extension, []).append((file_path, size))
+
+    stratum_bytes = {extension: sum(size for _, size in files) for extension, files in strata.items()}
+    total_bytes = sum(stratum_bytes.values())
+    rng = random.Random(seed)
+    sample = []
+    sizes = {}
+    for extension, files in strata.items():
+        share = round(sample_files * stratum_bytes[extension] / total_bytes) if total_bytes else 0
+        for file_path, size in rng.sample(files, min(len(files), max(ESTIMATE_MIN_PER_EXTENSION, share))):
+            sample.append((file_path, extension))
+            sizes[file_path] = size
+
+    if cache is not None:
+        results = iter_cached_file_counts(sample, cache, jobs=resolve_jobs(jobs))
+    else:
+        results = iter_file_counts(sample, resolve_jobs(jobs))
+    if not total_only:
+        results = track(results, description="[bold blue]Sampling files", total=len(sample))
+
+    # Binary files are dropped from the file count; unreadable ones count with no tokens
+    observed: Dict[str, List[Tuple[int, Optional[Counts]]]] = {}
+    for result in results:
+        tokens = None if result.binary else result.tokens or zero_counts()
+        observed.setdefault(result.extension, []).append((sizes[result.path], tokens))
+
+    width = len(zero_counts())
+    total_tokens = [0.0] * width
+    total_variance = [0.0] * width
+    extension_stats = {}
+    extension_margins = {}
+    file_counts = {}
+    sampled = {}
+    for extension, files in strata.items():
+        points = observed.get(extension, [])
+        text_files = sum(1 for _, tokens in points if tokens is not None)
+        sampled[extension] = len(points)
+        if not text_files:
+            continue
+        estimates = []
+        margins = []
+        for i in range(width):
+            estimate, variance = ratio_estimate(
+                len(files), stratum_bytes[extension], [(size, tokens[i] if tokens is not None else 0) for size, tokens in points]
+            )
+            total_tokens[i] += estimate
+            total_variance[i] += variance
+            estimates.append(round(estimate))
+            margins.append(round(ESTIMATE_Z * math.sqrt(variance)))
+        extension_stats[extension] = tuple(estimates)
+        extension_margins[extension] = tuple(margins)
+        file_counts[extension] = round(len(files) * text_files / len(points))
+
+    return Estimate(
+        tuple(round(count) for count in total_tokens),
+        tuple(round(ESTIMATE_Z * math.sqrt(variance)) for variance in total_variance),
+        extension_stats,
+        extension_margins,
+        file_counts,
+        sampled,
+    )
+
+def print_results(total_tokens: Counts, extension_stats: Dict[str, Counts], file_counts: Dict[str, int]) -> None:
+    """Print totals and the extension, technology and context window tables."""
+    from rich.table import Table
+
+    labels = tokenizer_labels()
+    multiple = len(labels) > 1
+    token_columns = [f"Tokens ({label})" for label in labels] if multiple else ["Tokens"]
+
+    console.print("\n[bold cyan]Results:[/bold cyan]")
+    if multiple:
+        for label, count in zip(labels, total_tokens):
+            console.print(f"Total tokens ({label}): [green]{format_number(count)}[/green]")
+    else:
+        console.print(f"Total tokens: [green]{format_number(total_tokens[0])}[/green]")
+
+    # Create and populate extension table, ordered by the first tokenizer
+    ext_table = Table(title="\n[bold]Tokens by file extension[/bold]")
+    ext_table.add_column("Extension", style="cyan")
+    for column in token_columns:
+        ext_table.add_column(column, justify="right", style="green")
+    ext_table.add_column("Files", justify="right", style="yellow")
+
+    for ext, count in sorted(extension_stats.items(), key=lambda x: x[1][0], reverse=True):
+        ext_table.add_row(
+            ext,
+            *(f"{format_number(value)}" for value in count),
+            f"{file_counts[ext]}"
+        )
+    console.print(ext_table)
+
+    # Group results by technology category
+    tech_stats, tech_file_counts = technology_stats(extension_stats, file_counts)
+
+    # Create and populate technology table
+    tech_table = Table(title="\n[bold]Tokens by Technology[/bold]")
+    tech_table.add_column("Technology", style="magenta")
+    for column in token_columns:
+        tech_table.add_column(column, justify="right", style="green")
+    tech_table.add_column("Files", justify="right", style="yellow")
+
+    for tech, count in sorted(tech_stats.items(), key=lambda x: x[1][0], reverse=True):
+        tech_table.add_row(
+            tech,
+            *(f"{format_number(value)}" for value in count),
+            f"{tech_file_counts[tech]}"
+        )
+    console.print(tech_table)
+
+    print_context_windows(total_tokens)
+
+def print_duplicates(duplicates: DuplicateTracker, total_tokens: Counts, limit: int = 10) -> None:
+    """Print the unique-content total and the largest clusters of identical files."""
+    from rich.table import Table
+
+    unique_tokens = duplicates.unique_tokens()
+    console.print(
+        f"\nUnique content: [green]{format_number(unique_tokens[0])}[/green] of {format_number(total_tokens[0])} tokens, "
+        f"{duplicates.duplicate_files()} duplicate files"
+    )
+    clusters = duplicates.largest(limit)
+    if not clusters:
+        return
+
+    table = Table(title="\n[bold]Largest duplicate clusters[/bold]")
+    table.add_column("Files", style="cyan")
+    table.add_column("Copies", justify="right", style="yellow")
+    table.add_column("Tokens each", justify="right", style="green")
+    table.add_column("Extra tokens", justify="right", style="red")
+    for tokens, paths in clusters:
+        shown = "\n".join(paths[:3]) + (f"\n... and {len(paths) - 3} more" if len(paths) > 3 else "")
+        table.add_row(shown, f"{len(paths)}", format_number(tokens[0]), format_number(tokens[0] * (len(paths) - 1)))
+    console.print(table)
+
+def format_bytes(num: int) -> str:
+    """Format a byte count with a binary unit."""
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if num < 1024 or unit == 'GiB':
+            return f"{num:.0f} {unit}" if unit == 'B' else f"{num:.1f} {unit}"
+        num /= 1024
+
+def print_profile(report: Dict[str, object], out=console) -> None:
+    """Print a --profile report: phases, throughput, memory and the slowest and largest files."""
+    from rich.table import Table
+
+    out.print(
+        f"\n[bold cyan]Profile:[/bold cyan] {report['wallSeconds']:.2f}s wall, {report['cpuSeconds']:.2f}s CPU"
+        + (f" (+{report['childCpuSeconds']:.2f}s in child processes)" if report['childCpuSeconds'] else "")
+    )
+    out.print(
+        f"{report['files']} files, {format_bytes(report['bytes'])}: "
+        f"{report['filesPerSecond']:,.0f} files/s, {format_bytes(report['bytesPerSecond'])}/s, "
+        f"{report['tokensPerSecond']:,.0f} tokens/s"
+    )
+    out.print(
+        f"Peak RSS: {format_bytes(report['peakRssBytes'])}"
+        + (f" (largest child process {format_bytes(report['peakChildRssBytes'])})" if report['peakChildRssBytes'] else "")
+    )
+
+    phase_table = Table(title="\n[bold]Time by phase[/bold]")
+    phase_table.add_column("Phase", style="cyan")
+    phase_table.add_column("Wall", justify="right", style="green")
+    phase_table.add_column("CPU", justify="right", style="green")
+    phase_table.add_column("Volume", justify="right", style="yellow")
+    phase_table.add_column("Calls", justify="right")
+    for name, stats in report['phases'].items():
+        # Encode volume is in characters, read and stream volume in bytes
+        volume = format_number(stats['volume']) + " chars" if name == 'encode' else format_bytes(stats['volume'])
+        phase_table.add_row(name, f"{stats['wallSeconds']:.3f}s", f"{stats['cpuSeconds']:.3f}s", volume if stats['volume'] else "", f"{stats['calls']}")
+    out.print(phase_table)
+
+    for title, key in (("Slowest files", 'slowestFiles'), ("Largest files", 'largestFiles')):
+        if not report[key]:
+            continue
+        file_table = Table(title=f"\n[bold]{title}[/bold]")
+        file_table.add_column("File", style="cyan")
+        file_table.add_column("Time", justify="right", style="green")
+        file_table.add_column("Size", justify="right", style="yellow")
+        for entry in report[key]:
+            file_table.add_row(entry['path'], f"{entry['seconds'] * 1000:.1f} ms", format_bytes(entry['bytes']))
+        out.print(file_table)
+
+def print_context_windows(total_tokens: Counts, margins: Optional[Counts] = None) -> None:
+    """Print the context window table, each model measured with its own tokenizer.
+
+    With margins, usage is shown as a range and is yellow when the range straddles the window.
+    """
+    from rich.table import Table
+
+    labels = tokenizer_labels()
+    multiple = len(labels) > 1
+    context_table = Table(title="\n[bold]Context Window Comparisons[/bold]")
+    context_table.add_column("Model", style="blue")
+    if multiple:
+        context_table.add_column("Tokenizer", style="cyan")
+    context_table.add_column("Context Usage", justify="right")
+
+    for model, (window, family) in CONTEXT_WINDOWS.items():
+        index = labels.index(family) if family in labels else 0
+        multiplier = total_tokens[index] / window
+        if margins is None:
+            color = "red" if multiplier > 1 else "green"
+            usage = f"[{color}]{multiplier:.1f}x[/{color}]"
+        else:
+            low = max(0, total_tokens[index] - margins[index]) / window
+            high = (total_tokens[index] + margins[index]) / window
+            color = "red" if low > 1 else "green" if high <= 1 else "yellow"
+            usage = f"[{color}]{low:.1f}x-{high:.1f}x[/{color}]"
+        if multiple:
+            context_table.add_row(model, labels[index], usage)
+        else:
+            context_table.add_row(model, usage)
+    console.print(context_table)
+
+def print_estimate(estimate: 'Estimate') -> None:
+    """Print an estimated total and extension table with 95% confidence margins."""
+    from rich.table import Table
+
+    labels = tokenizer_labels()
+    multiple = len(labels) > 1
+    suffixes = [f" ({label})" for label in labels] if multiple else [""]
+    sampled_files = sum(estimate.sampled.values())
+
+    console.print(f"\n[bold cyan]Estimate from {sampled_files} sampled files (95% confidence):[/bold cyan]")
+    for suffix, count, margin in zip(suffixes, estimate.total_tokens, estimate.total_margin):
+        console.print(f"Total tokens{suffix}: [green]{format_number(count)}[/green] ± {format_number(margin)}")
+
+    ext_table = Table(title="\n[bold]Estimated tokens by file extension[/bold]")
+    ext_table.add_column("Extension", style="cyan")
+    for suffix in suffixes:
+        ext_table.add_column(f"Tokens{suffix}", justify="right", style="green")
+        ext_table.add_column("±", justify="right")
+    ext_table.add_column("Files", justify="right", style="yellow")
+    ext_table.add_column("Sampled", justify="right")
+
+    for ext, count in sorted(estimate.extension_stats.items(), key=lambda x: x[1][0], reverse=True):
+        cells = []
+        for value, margin in zip(count, estimate.extension_margins[ext]):
+            cells += [format_number(value), format_number(margin)]
+        ext_table.add_row(ext, *cells, f"{estimate.file_counts[ext]}", f"{estimate.sampled[ext]}")
+    console.print(ext_table)
+
+    print_context_windows(estimate.total_tokens, estimate.total_margin)
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(prog="token-counter", description="Count LLM tokens in a repository.")
+    parser.add_argument("target", help="Repository URL or local directory to analyze")
+    parser.add_argument("-total", action="store_true", help="Only print the total number of tokens")
+    parser.add_argument(
+        "--tokenizer",
+        action="append",
+        metavar="[LABEL=]SPEC",
+        help=(
+            "Tokenizer to count with: a Hugging Face Hub id, a local tokenizer directory "
+            "or a tokenizer.json file. Repeat to count with several tokenizers in one pass; "
+            "label one with a model family (openai, google, xai, anthropic, qwen, glm, deepseek) "
+            f"to use it for that family's context windows (default: {TOKENIZER_NAME})"
+        ),
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Never contact the Hugging Face Hub; the tokenizer must be local or already cached",
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=1,
+        help="Number of tokenizer worker processes (0 = one per CPU, default: 1)",
+    )
+    parser.add_argument(
+        "--git-index",
+        action="store_true",
+        help="List tracked files from the git index instead of walking the filesystem",
+    )
+    parser.add_argument(
+        "--objects",
+        action="store_true",
+        help="Read blobs from the git object store instead of a work tree (URLs get a bare, blobless clone)",
+    )
+    parser.add_argument(
+        "--ref",
+        help="Commit, branch or tag to count in --objects mode (default: HEAD; implies --objects)",
+    )
+    parser.add_argument(
+        "--history",
+        metavar="RANGE",
+        help="Emit a per-commit token series for a revision range (e.g. v1.0..HEAD) along the first-parent chain",
+    )
+    parser.add_argument(
+        "--history-format",
+        choices=("json", "csv"),
+        default="json",
+        help="Format of the --history series (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-o", "--output",
+        type=Path,
+        help="Write the --history series to this file instead of stdout, or with --budget the paths of the files that fit",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Reuse token counts from a persistent cache keyed by file content",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=default_cache_dir(),
+        help="Directory holding the token cache (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--cache-max-entries",
+        type=int,
+        default=DEFAULT_CACHE_MAX_ENTRIES,
+        help="Evict least recently used cache entries beyond this count (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--estimate",
+        action="store_true",
+        help="Extrapolate from file sizes and a stratified sample per extension instead of tokenizing every file",
+    )
+    parser.add_argument(
+        "--sample-files",
+        type=int,
+        default=ESTIMATE_SAMPLE_FILES,
+        help="Number of files to tokenize in --estimate mode (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        help="Random seed for the --estimate sample, for reproducible estimates",
+    )
+    parser.add_argument(
+        "--budget",
+        type=int,
+        metavar="N",
+        help=f"Stop as soon as the total exceeds N tokens (first tokenizer) and exit with status {EXIT_OVER_BUDGET}",
+    )
+    parser.add_argument(
+        "--order",
+        choices=("walk", "largest", "smallest"),
+        default="walk",
+        help=(
+            "Order in which --budget counts files: largest first finds an overrun soonest, "
+            "smallest first fits the most files (default: %(default)s)"
+        ),
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="After the first count, keep the tokenizer loaded and update the totals as files change",
+    )
+    parser.add_argument(
+        "--status-file",
+        type=Path,
+        help="In --watch mode, rewrite this JSON file with the current totals after every update",
+    )
+    parser.add_argument(
+        "--status-socket",
+        type=Path,
+        help="In --watch mode, serve the current totals as JSON on this Unix socket",
+    )
+    parser.add_argument(
+        "--duplicates",
+        action="store_true",
+        help="Also report the total with identical files counted once and the largest clusters of identical files",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Report time per phase, throughput, peak memory and the slowest and largest files",
+    )
+    parser.add_argument(
+        "--profile-json",
+        type=Path,
+        metavar="PATH",
+        help="Write the --profile report as JSON to PATH (implies --profile)",
+    )
+    args = parser.parse_args(argv)
+    if args.duplicates and (args.estimate or args.budget is not None or args.watch or args.objects or args.ref is not None or args.history is not None):
+        parser.error("--duplicates cannot be combined with --estimate, --budget, --watch, --objects, --ref or --history")
+    if args.watch and (args.estimate or args.budget is not None or args.objects or args.ref is not None or args.history is not None):
+        parser.error("--watch follows a work tree and cannot be combined with --estimate, --budget, --objects, --ref or --history")
+    if (args.status_file is not None or args.status_socket is not None) and not args.watch:
+        parser.error("--status-file and --status-socket require --watch")
+    if args.budget is not None and (args.estimate or args.objects or args.ref is not None or args.history is not None):
+        parser.error("--budget counts a work tree and cannot be combined with --estimate, --objects, --ref or --history")
+    if args.estimate and (args.objects or args.ref is not None or args.history is not None or args.git_index):
+        parser.error("--estimate walks a work tree and cannot be combined with --objects, --ref, --history or --git-index")
+    return args
+
 def main():
-    # Check for correct number of arguments
-    if len(sys.argv) < 2:
-        console.print("[red]Usage: token-counter <repository_url_or_path> [-total][/red]")
-        sys.exit(1)
-        
-    # Check for -total flag
-    total_only = "-total" in sys.argv
-    target = sys.argv[1] if sys.argv[1] != "-total" else sys.argv[2]
+    args = parse_args(sys.argv[1:])
+    total_only = args.total
+    target = args.target
+    if args.history is not None and args.output is None:
+        # The series goes to stdout, so keep progress output off it
+        total_only = True
     
     # Suppress all warnings if total_only is True
     if total_only:
         import logging
         logging.getLogger('transformers').setLevel(logging.ERROR)
 
+    tokenizer_specs = [parse_tokenizer_arg(value) for value in args.tokenizer or [TOKENIZER_NAME]]
+    configure_tokenizers(tokenizer_specs, args.offline)
+
+    global _profiler
+    profile = args.profile or args.profile_json is not None
+    if profile:
+        _profiler = Profiler()
+        with _profiler.phase('load'):
+            get_tokenizers()
+
     temp_dir = None
+    objects_mode = args.objects or args.ref is not None or args.history is not None
+    repo = None
+
+    if args.watch and not os.path.isdir(target):
+        console.print(f"[red]--watch needs a local directory: {target}[/red]")
+        sys.exit(1)
 
     # Check if the target is a local directory
     if os.path.isdir(target):
         if not total_only:
             console.print(f"[green]Analyzing local directory: {target}[/green]")
         analyze_path = target
+        if objects_mode:
+            from git import Repo
+            from git.exc import InvalidGitRepositoryError, NoSuchPathError
+
+            try:
+                repo = Repo(target, search_parent_directories=True)
+            except (InvalidGitRepositoryError, NoSuchPathError):
+                console.print(f"[red]Not a git repository: {target}[/red]")
+                sys.exit(1)
     else:
         # Clone the repository to a temporary directory
         temp_dir = tempfile.mkdtemp()
         if not total_only:
             console.print(f"[yellow]Cloning repository: {target}[/yellow]")
         try:
-            Repo.clone_from(target, temp_dir)
+            if objects_mode:
+                repo = clone_for_objects(target, temp_dir)
+            else:
+                clone_repository(target, temp_dir)
             analyze_path = temp_dir
         except Exception as e:
             console.print(f"[red]Error cloning repository: {str(e)}[/red]")
             shutil.rmtree(temp_dir)
             sys.exit(1)
 
+    cache = None
     try:
-        total_tokens, extension_stats, file_counts = process_repository(analyze_path, total_only)
+        if args.cache:
+            cache = TokenCache(args.cache_dir, [tokenizer_identity(spec) for _, spec in tokenizer_specs], args.cache_max_entries)
+        if args.history is not None:
+            points = process_history(
+                repo, args.history, total_only, resolve_jobs(args.jobs), cache, partial=temp_dir is not None
+            )
+            if args.output is not None:
+                with open(args.output, 'w', encoding='utf-8', newline='') as output:
+                    write_history(points, output, args.history_format)
+            else:
+                write_history(points, sys.stdout, args.history_format)
+            if temp_dir:
+                shutil.rmtree(temp_dir)
+            return
+        if args.watch:
+            watch_repository(analyze_path, total_only, args.jobs, cache, args.status_file, args.status_socket)
+            return
+        if args.budget is not None:
+            budget_result = process_budget(analyze_path, args.budget, args.order, total_only, args.jobs, cache, args.git_index)
+            total_tokens = budget_result.total_tokens
+        elif args.estimate:
+            estimate = estimate_repository(analyze_path, total_only, args.jobs, cache, args.sample_files, args.seed)
+            total_tokens = estimate.total_tokens
+        elif repo is not None:
+            total_tokens, extension_stats, file_counts = process_git_tree(
+                repo, args.ref or 'HEAD', total_only, resolve_jobs(args.jobs), cache, partial=temp_dir is not None
+            )
+        else:
+            duplicates = DuplicateTracker() if args.duplicates else None
+            total_tokens, extension_stats, file_counts = process_repository(
+                analyze_path, total_only, args.jobs, cache, args.git_index, duplicates=duplicates
+            )
     except Exception as e:
         if not total_only:
             console.print(f"[red]Error analyzing repository: {str(e)}[/red]")
         if temp_dir:
             shutil.rmtree(temp_dir)
         sys.exit(1)
+    finally:
+        if cache is not None:
+            cache.close()
+        if repo is not None:
+            repo.close()
 
     # Print results
-    if total_only:
+    render_wall = time.perf_counter()
+    render_cpu = time.thread_time()
+    if total_only and args.estimate:
+        # The estimate and its 95% margin
+        if len(total_tokens) == 1:
+            print(f"{total_tokens[0]}\t{estimate.total_margin[0]}")
+        else:
+            for label, count, margin in zip(tokenizer_labels(), total_tokens, estimate.total_margin):
+                print(f"{label}\t{count}\t{margin}")
+    elif total_only and args.duplicates:
+        # The total and the total with identical files counted once
+        unique_tokens = duplicates.unique_tokens()
+        if len(total_tokens) == 1:
+            print(f"{total_tokens[0]}\t{unique_tokens[0]}")
+        else:
+            for label, count, unique in zip(tokenizer_labels(), total_tokens, unique_tokens):
+                print(f"{label}\t{count}\t{unique}")
+    elif total_only:
         # Only print the total number
-        print(total_tokens)
+        if len(total_tokens) == 1:
+            print(total_tokens[0])
+        else:
+            for label, count in zip(tokenizer_labels(), total_tokens):
+                print(f"{label}\t{count}")
+    elif args.budget is not None:
+        print_budget(budget_result, args.budget)
+    elif args.estimate:
+        print_estimate(estimate)
     else:
-        console.print("\n[bold cyan]Results:[/bold cyan]")
-        console.print(f"Total tokens: [green]{format_number(total_tokens)}[/green]")
-
-    if not total_only:
-        # Create and populate extension table
-        ext_table = Table(title="\n[bold]Tokens by file extension[/bold]")
-        ext_table.add_column("Extension", style="cyan")
-        ext_table.add_column("Tokens", justify="right", style="green")
-        ext_table.add_column("Files", justify="right", style="yellow")
-
-        for ext, count in sorted(extension_stats.items(), key=lambda x: x[1], reverse=True):
-            ext_table.add_row(
-                ext,
-                f"{format_number(count)}",
-                f"{file_counts[ext]}"
-            )
-        console.print(ext_table)
-
-        # Group results by technology category
-        tech_stats = {}
-        tech_file_counts = {}
-        for ext, count in extension_stats.items():
-            tech = FILE_EXTENSIONS[ext]
-            tech_stats[tech] = tech_stats.get(tech, 0) + count
-            tech_file_counts[tech] = tech_file_counts.get(tech, 0) + file_counts[ext]
-
-        # Create and populate technology table
-        tech_table = Table(title="\n[bold]Tokens by Technology[/bold]")
-        tech_table.add_column("Technology", style="magenta")
-        tech_table.add_column("Tokens", justify="right", style="green")
-        tech_table.add_column("Files", justify="right", style="yellow")
-
-        for tech, count in sorted(tech_stats.items(), key=lambda x: x[1], reverse=True):
-            tech_table.add_row(
-                tech,
-                f"{format_number(count)}",
-                f"{tech_file_counts[tech]}"
-            )
-        console.print(tech_table)
-
-        # Create and populate context window table with latest models (2025)
-        windows = {
-            # OpenAI Models
-            "GPT-5 Codex": 400000,
-            "GPT-4o": 128000,
-
-            # Google Models
-            "Gemini 2.5 Pro": 1000000,
+        print_results(total_tokens, extension_stats, file_counts)
+        if args.duplicates:
+            print_duplicates(duplicates, total_tokens)
 
-            # xAI Models
-            "Grok 4 Fast": 2000000,
-            "Grok Code Fast": 256000,
+    if args.budget is not None and args.output is not None:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            for relative_path, _ in budget_result.fitted:
+                output.write(relative_path + '\n')
 
-            # Anthropic Models
-            "Claude Sonnet 4.5": 200000,
-            "Claude Haiku 4.5": 200000,
-
-            # Open Source Models
-            "Qwen 3 Coder": 256000,
-            "GLM 4.6": 200000,
-            "DeepSeek 3.2": 128000,
-        }
-
-        context_table = Table(title="\n[bold]Context Window Comparisons[/bold]")
-        context_table.add_column("Model", style="blue")
-        context_table.add_column("Context Usage", justify="right")
-
-        for model, window in windows.items():
-            multiplier = total_tokens / window
-            color = "red" if multiplier > 1 else "green"
-            context_table.add_row(model, f"[{color}]{multiplier:.1f}x[/{color}]")
-        console.print(context_table)
+    if profile:
+        _profiler.record('render', time.perf_counter() - render_wall, time.thread_time() - render_cpu)
+        report = _profiler.report(total_tokens[0], analyze_path)
+        if args.profile_json is not None:
+            with open(args.profile_json, 'w', encoding='utf-8') as output:
+                json.dump(report, output, indent=2)
+                output.write('\n')
+        if args.profile:
+            # Keep stdout to the bare total in -total mode
+            if total_only:
+                from rich.console import Console
+                print_profile(report, Console(stderr=True))
+            else:
+                print_profile(report)
 
     if temp_dir:
         shutil.rmtree(temp_dir)
+    if args.budget is not None and budget_result.exceeded:
+        sys.exit(EXIT_OVER_BUDGET)
 
 if __name__ == "__main__":
     main()